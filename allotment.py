@@ -0,0 +1,287 @@
+"""Batch project allotment.
+
+stable_match() runs student-proposing deferred acceptance (Gale-Shapley) with project
+capacities. The result is stable: no student and project both prefer each other to what
+they were given. Among stable matchings it is the one every student likes best.
+
+Each project keeps the applicants it currently holds in a heap keyed by its rank of them,
+so a proposal costs O(log capacity). A whole run is O(P log C), where P is the number of
+(student, project) preferences.
+
+optimal_match() instead maximises how many students are placed and, among those
+placements, how well they did by their own preferences (the sum of each student's
+position of the project they got). It also respects per-faculty limits. It is solved as
+a min-cost flow: source -> student -> project -> guide -> sink, with the project's seats
+and the guide's limit as capacities. The graph is kept in flat lists (edge e and its
+reverse e ^ 1 side by side), and each shortest-path round augments along every
+shortest path it found before searching again, so a run needs a few dozen Dijkstra
+passes rather than one per student.
+
+The module knows nothing about Flask or Mongo; app.py builds the inputs from the
+application collection and writes the result back.
+"""
+import heapq
+
+
+def stable_match(student_prefs, project_ranks, capacities):
+    """Match students to projects.
+
+    student_prefs: {student: [project, ...]} best first
+    project_ranks: {project: {student: rank}}, lower is better; students missing from a
+        project's ranking are not acceptable to it
+    capacities: {project: seats}; None means unlimited, projects missing here take nobody
+
+    Returns {student: project} for every matched student.
+    """
+    held = {}  # project -> heap of (-rank, student); the root is the weakest student held
+    unlimited = {}  # project -> [student]
+    next_choice = dict.fromkeys(student_prefs, 0)
+    free = list(student_prefs)
+    free.reverse()  # propose in input order; only affects which stable matching ties resolve to, not stability
+
+    while free:
+        student = free.pop()
+        prefs = student_prefs[student]
+        while next_choice[student] < len(prefs):
+            project = prefs[next_choice[student]]
+            next_choice[student] += 1
+            rank = project_ranks.get(project, {}).get(student)
+            if rank is None or project not in capacities:
+                continue
+            seats = capacities[project]
+            if seats is None:
+                unlimited.setdefault(project, []).append(student)
+                break
+            heap = held.setdefault(project, [])
+            if len(heap) < seats:
+                heapq.heappush(heap, (-rank, student))
+                break
+            if heap and -heap[0][0] > rank:
+                # The project prefers this student to the weakest one it holds
+                _, displaced = heapq.heapreplace(heap, (-rank, student))
+                free.append(displaced)
+                break
+        # a student who runs out of choices stays unmatched
+
+    matching = {student: project for project, heap in held.items() for _, student in heap}
+    for project, students in unlimited.items():
+        for student in students:
+            matching[student] = project
+    return matching
+
+
+def blocking_pairs(matching, student_prefs, project_ranks, capacities):
+    # (student, project) pairs that would both rather be together; empty for a stable matching
+    assigned = {}
+    for student, project in matching.items():
+        assigned.setdefault(project, []).append(project_ranks[project][student])
+    pairs = []
+    for student, prefs in student_prefs.items():
+        current = matching.get(student)
+        for project in prefs:
+            if project == current:
+                break
+            rank = project_ranks.get(project, {}).get(student)
+            seats = capacities.get(project, 0)
+            if rank is None or project not in capacities:
+                continue
+            taken = assigned.get(project, [])
+            if seats is None or len(taken) < seats or (taken and max(taken) > rank):
+                pairs.append((student, project))
+    return pairs
+
+
+def choice_counts(matching, student_prefs):
+    # counts[i] is how many students got their (i + 1)-th choice
+    counts = [0] * max((len(prefs) for prefs in student_prefs.values()), default=0)
+    for student, project in matching.items():
+        counts[student_prefs[student].index(project)] += 1
+    return counts
+
+
+class _Graph:
+    # Forward-star layout: edge e runs to to[e], edge e ^ 1 is its reverse, next_edge[e]
+    # is the following edge out of the same node and head[u] the first one
+    def __init__(self, nodes):
+        self.head = [-1] * nodes
+        self.to = []
+        self.cap = []
+        self.cost = []
+        self.next_edge = []
+
+    def add_edge(self, u, v, cap, cost):
+        e = len(self.to)
+        self.to += (v, u)
+        self.cap += (cap, 0)
+        self.cost += (cost, -cost)
+        self.next_edge += (self.head[u], self.head[v])
+        self.head[u] = e
+        self.head[v] = e + 1
+        return e
+
+
+def _min_cost_flow(graph, source, sink):
+    # Push as much flow as possible at the least total cost (primal-dual). Costs must be
+    # non-negative integers; the flow is left in graph.cap.
+    head, to, cap, cost, next_edge = graph.head, graph.to, graph.cap, graph.cost, graph.next_edge
+    nodes = len(head)
+    potential = [0] * nodes
+    unreached = float("inf")
+    while True:
+        # Dijkstra on reduced costs, stopping once the sink is settled
+        dist = [unreached] * nodes
+        dist[source] = 0
+        settled = [False] * nodes
+        queue = [(0, source)]
+        while queue:
+            d, u = heapq.heappop(queue)
+            if settled[u]:
+                continue
+            settled[u] = True
+            if u == sink:
+                break
+            base = d + potential[u]
+            e = head[u]
+            while e != -1:
+                if cap[e]:
+                    v = to[e]
+                    nd = base + cost[e] - potential[v]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        heapq.heappush(queue, (nd, v))
+                e = next_edge[e]
+        if dist[sink] == unreached:
+            return
+        # Capping at the sink's distance keeps every reduced cost non-negative
+        limit = dist[sink]
+        for v in range(nodes):
+            potential[v] += min(dist[v], limit)
+
+        # Every shortest path now uses only zero reduced-cost edges: saturate them, Dinic style
+        while True:
+            level = [-1] * nodes
+            level[source] = 0
+            frontier = [source]
+            while frontier and level[sink] < 0:
+                following = []
+                for u in frontier:
+                    e = head[u]
+                    while e != -1:
+                        v = to[e]
+                        if cap[e] and level[v] < 0 and cost[e] + potential[u] == potential[v]:
+                            level[v] = level[u] + 1
+                            following.append(v)
+                        e = next_edge[e]
+                frontier = following
+            if level[sink] < 0:
+                break
+            current = head[:]
+            while _augment(graph, potential, level, current, source, sink):
+                pass
+
+
+def _augment(graph, potential, level, current, source, sink):
+    # One augmenting path along the level graph; current[] remembers where each node's scan stopped
+    to, cap, cost, next_edge = graph.to, graph.cap, graph.cost, graph.next_edge
+    path = []
+    u = source
+    while u != sink:
+        e = current[u]
+        while e != -1:
+            v = to[e]
+            if cap[e] and level[v] == level[u] + 1 and cost[e] + potential[u] == potential[v]:
+                break
+            e = next_edge[e]
+        current[u] = e
+        if e != -1:
+            path.append(e)
+            u = v
+        elif not path:
+            return 0
+        else:
+            # dead end: back up and skip the edge that led here
+            u = to[path.pop() ^ 1]
+            current[u] = next_edge[current[u]]
+    pushed = min(cap[e] for e in path)
+    for e in path:
+        cap[e] -= pushed
+        cap[e ^ 1] += pushed
+    return pushed
+
+
+def optimal_match(student_prefs, project_ranks, capacities, project_guides=None, faculty_capacities=None,
+                  co_guides=None):
+    """Place as many students as possible, as high on their own lists as possible.
+
+    student_prefs, project_ranks and capacities are as for stable_match(); the guides'
+    ranks only decide who is acceptable here, not who is preferred.
+    project_guides: {project: faculty} for the guide whose limit the project counts against
+    faculty_capacities: {faculty: students}; faculty missing here have no limit
+    co_guides: {(student, project): faculty} for applications supervised with a co-guide,
+        which count against the co-guide's limit too
+
+    A student counts against one guide along a flow path, so co-guide limits are checked
+    after solving: a faculty member left over their limit loses their co-guided placements
+    with the worst preference, and the rest is solved again. The result always respects
+    every limit, but may fall slightly short of the optimum when co-guide limits bind.
+
+    Returns {student: project} for every placed student.
+    """
+    project_guides = project_guides or {}
+    faculty_capacities = faculty_capacities or {}
+    co_guides = co_guides or {}
+    excluded = set()
+    while True:
+        matching = _solve(student_prefs, project_ranks, capacities, project_guides, faculty_capacities, excluded)
+        load = {}
+        co_guided = {}
+        for student, project in matching.items():
+            guide = project_guides.get(project)
+            load[guide] = load.get(guide, 0) + 1
+            co_guide = co_guides.get((student, project))
+            if co_guide is not None:
+                load[co_guide] = load.get(co_guide, 0) + 1
+                co_guided.setdefault(co_guide, []).append((student_prefs[student].index(project), student, project))
+        over = False
+        for faculty, placed in co_guided.items():
+            excess = load[faculty] - faculty_capacities.get(faculty, load[faculty])
+            if excess > 0:
+                over = True
+                placed.sort(reverse=True)
+                excluded.update((student, project) for _, student, project in placed[:excess])
+        if not over:
+            return matching
+
+
+def _solve(student_prefs, project_ranks, capacities, project_guides, faculty_capacities, excluded):
+    students = list(student_prefs)
+    projects = [project for project, seats in capacities.items() if seats is None or seats > 0]
+    faculty = sorted({project_guides[project] for project in projects if project in project_guides}, key=str)
+    source, sink = 0, 1
+    student_node = {student: 2 + i for i, student in enumerate(students)}
+    project_node = {project: 2 + len(students) + i for i, project in enumerate(projects)}
+    faculty_node = {member: 2 + len(students) + len(projects) + i for i, member in enumerate(faculty)}
+    graph = _Graph(2 + len(students) + len(projects) + len(faculty))
+    everyone = len(students)
+
+    for member, node in faculty_node.items():
+        limit = faculty_capacities.get(member)
+        graph.add_edge(node, sink, everyone if limit is None else limit, 0)
+    for project, node in project_node.items():
+        seats = capacities[project]
+        guide = project_guides.get(project)
+        graph.add_edge(node, faculty_node[guide] if guide is not None else sink, everyone if seats is None else seats, 0)
+    choices = []  # (edge, student, project)
+    for student, prefs in student_prefs.items():
+        node = student_node[student]
+        graph.add_edge(source, node, 1, 0)
+        seen = set()
+        for position, project in enumerate(prefs):
+            if (project in seen or project not in project_node or (student, project) in excluded
+                    or project_ranks.get(project, {}).get(student) is None):
+                continue
+            seen.add(project)
+            choices.append((graph.add_edge(node, project_node[project], 1, position), student, project))
+
+    _min_cost_flow(graph, source, sink)
+    return {student: project for e, student, project in choices if not graph.cap[e]}
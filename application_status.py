@@ -0,0 +1,60 @@
+"""Application statuses and the transitions allowed between them.
+
+Every status change goes through this module. Each change is a single conditional write
+that only matches while the application is still in one of the states allowed to reach
+the new one, so two concurrent clicks cannot both win and a stale page cannot move an
+application backwards. transition() returns the updated document (or None when the
+application was not in an allowed state), so callers need no follow-up read.
+"""
+from pymongo import ReturnDocument, UpdateOne
+
+PENDING = "Pending"
+APPROVED = "Approved"
+APPROVED_BY_GUIDE = "Approved by Guide"
+APPLIED_FOR_CO_GUIDE = "Applied for Co-Guide"
+TEMPORARILY_CONFIRMED = "Temporarily Confirmed"
+CONFIRMED = "Confirmed"
+
+# current status -> statuses it may move to
+TRANSITIONS = {
+    PENDING: {APPROVED, APPROVED_BY_GUIDE},  # guide approves; a guide from another department picks co-guides first
+    APPROVED: {PENDING, TEMPORARILY_CONFIRMED},  # guide withdraws approval; student confirms the project
+    APPROVED_BY_GUIDE: {APPLIED_FOR_CO_GUIDE, PENDING},
+    APPLIED_FOR_CO_GUIDE: {APPLIED_FOR_CO_GUIDE, APPROVED, PENDING},  # student may re-send to other co-guides
+    TEMPORARILY_CONFIRMED: {APPROVED, CONFIRMED},  # student confirms another project; letter sent to the HOD
+    CONFIRMED: set()
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def sources(to, expected=None):
+    # States allowed to move to `to`, narrowed to `expected` when the caller knows better
+    allowed = {state for state, targets in TRANSITIONS.items() if to in targets}
+    if expected is None:
+        return sorted(allowed)
+    expected = {expected} if isinstance(expected, str) else set(expected)
+    if not expected <= allowed:
+        raise InvalidTransition(f"cannot move {sorted(expected - allowed)} to {to!r}")
+    return sorted(expected)
+
+
+def _update(to, fields=None, unset=None):
+    update = {"$set": {"status": to, **(fields or {})}}
+    if unset:
+        update["$unset"] = {field: "" for field in unset}
+    return update
+
+
+def transition(collection, query, to, expected=None, fields=None, unset=None, session=None):
+    # Move one application; returns the updated document, or None if none matched in an allowed state
+    return collection.find_one_and_update({**query, "status": {"$in": sources(to, expected)}},
+                                          _update(to, fields, unset),
+                                          return_document=ReturnDocument.AFTER, session=session)
+
+
+def transition_op(query, to, expected=None, fields=None, unset=None):
+    # The same conditional update as transition(), for a bulk_write
+    return UpdateOne({**query, "status": {"$in": sources(to, expected)}}, _update(to, fields, unset))
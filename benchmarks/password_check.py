@@ -0,0 +1,60 @@
+"""Password checks per second per core: plaintext comparison vs calibrated scrypt.
+
+Only PasswordHasher.verify() is timed. The user lookup, session and HTTP work of
+login() are left out, so these numbers are not login throughput; they show how much
+CPU the hash check alone takes, which is the part that changed when passwords
+started being hashed.
+
+    python benchmarks/password_check.py [--target-ms 50] [--seconds 3]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, calibrate  # noqa: E402
+
+
+def rate(check, seconds, threads=1):
+    # checks per second, with `threads` request threads calling check() back to back
+    deadline = time.perf_counter() + seconds
+
+    def loop():
+        done = 0
+        while time.perf_counter() < deadline:
+            check()
+            done += 1
+        return done
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        total = sum(pool.map(lambda _: loop(), range(threads)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+    cores = os.cpu_count() or 1
+
+    n = calibrate(args.target_ms)
+    hasher = PasswordHasher(n=n)
+    stored = hasher.hash("correct horse battery staple")
+    legacy = PasswordHasher(n=n)
+
+    print(f"cores: {cores}, scrypt n={n} r=8 p=1 ({128 * 8 * n // (1024 * 1024)} MB per check)")
+    before = rate(lambda: legacy.verify("correct horse battery staple", "correct horse battery staple"), args.seconds)
+    print(f"before  plaintext compare     {before:12.0f} checks/s per core")
+    after = rate(lambda: hasher.verify(stored, "correct horse battery staple"), args.seconds)
+    print(f"after   scrypt, 1 thread      {after:12.1f} checks/s per core ({1000 / after:.1f} ms each)")
+    threaded = rate(lambda: hasher.verify(stored, "correct horse battery staple"), args.seconds, threads=cores * 4)
+    print(f"after   scrypt, {cores * 4} threads     {threaded / cores:12.1f} checks/s per core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""HOD application letters rendered as in-memory PDFs.
+
+Kept free of the Flask app and the database so a ProcessPoolExecutor can import it
+cheaply in its workers.
+"""
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+
+def _draw_letter(c, data):
+    # data: btp_id, btp_name, name, dep, coguide_name, faculty_name
+    c.drawString(100, 780, f"BTP Id: {data['btp_id']}")
+    c.drawString(100, 760, f"BTP NAME: {data['btp_name']}")
+    c.drawString(100, 740, f"Name: {data['name']}")
+    c.drawString(100, 720, f"Department: {data['dep']}")
+    c.drawString(100, 700, f"Co-Guide Name: {data['coguide_name']}")
+    c.drawString(100, 680, f"Faculty Name: {data['faculty_name']}")
+
+
+def render_letter(data):
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    _draw_letter(c, data)
+    c.save()
+    return buffer.getvalue()
+
+
+def render_digest(letters):
+    # One PDF with a page per letter, for the department digest mail
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    for data in letters:
+        _draw_letter(c, data)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def zip_letters(named_pdfs):
+    # named_pdfs: [(filename, pdf bytes)]
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for filename, pdf in named_pdfs:
+            archive.writestr(filename, pdf)
+    return buffer.getvalue()
+
+
+def render_letters(letters, processes=0, pool_threshold=50):
+    # Render a batch in order; large batches are spread over a process pool when processes > 0
+    letters = list(letters)
+    if processes and len(letters) >= pool_threshold:
+        chunksize = max(1, len(letters) // (processes * 4))
+        with ProcessPoolExecutor(processes) as pool:
+            return list(pool.map(render_letter, letters, chunksize=chunksize))
+    return [render_letter(data) for data in letters]
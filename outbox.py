@@ -0,0 +1,249 @@
+"""Mongo-backed outbox for outgoing email.
+
+Request handlers call Outbox.enqueue() and return straight away. A small pool of
+background threads claims due messages from the collection and delivers them over
+SMTP, retrying failures with exponential backoff. Claiming is a single
+find_one_and_update, so several processes can drain the same outbox safely.
+
+Deliveries share an SMTPPool, which keeps logged-in SMTP sessions open between
+messages instead of paying a TLS handshake and login for each one.
+
+Work that produces mail on a schedule (such as the HOD digests) can be registered
+with every(); the first worker thread runs it between deliveries, so it never
+happens on a request thread.
+"""
+import smtplib
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, ReturnDocument
+
+
+def smtp_connect(settings):
+    # settings: host, port, use_ssl, use_tls, username, password, timeout
+    timeout = settings.get('timeout', 30)
+    if settings.get('use_ssl'):
+        server = smtplib.SMTP_SSL(settings['host'], settings['port'], context=ssl.create_default_context(), timeout=timeout)
+    else:
+        server = smtplib.SMTP(settings['host'], settings['port'], timeout=timeout)
+        if settings.get('use_tls'):
+            server.starttls(context=ssl.create_default_context())
+    if settings.get('username'):
+        server.login(settings['username'], settings['password'])
+    return server
+
+
+class SMTPPool:
+    def __init__(self, settings, size=2, max_idle=60, max_messages=100):
+        # max_idle: seconds an idle session is trusted before it is replaced
+        # max_messages: providers such as Gmail cap how much one session may send
+        self.settings = settings
+        self.size = size
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self.connections_opened = 0
+        self._idle = []  # [server, messages_sent, last_used]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _checkout(self, fresh=False):
+        now = time.monotonic()
+        with self._lock:
+            while self._idle and not fresh:
+                entry = self._idle.pop()
+                if now - entry[2] <= self.max_idle:
+                    return entry, True
+                self._quit(entry[0])
+        server = smtp_connect(self.settings)
+        with self._lock:
+            self.connections_opened += 1
+        return [server, 0, now], False
+
+    def _checkin(self, entry):
+        entry[1] += 1
+        entry[2] = time.monotonic()
+        if entry[1] >= self.max_messages:
+            self._quit(entry[0])
+            return
+        with self._lock:
+            self._idle.append(entry)
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    @contextmanager
+    def connection(self, fresh=False):
+        # Yields (server, reused); at most `size` sessions are open at once
+        with self._slots:
+            entry, reused = self._checkout(fresh)
+            try:
+                yield entry[0], reused
+            except smtplib.SMTPResponseException:
+                # The server answered (e.g. 451 or a refused recipient); the session is still usable
+                self._checkin(entry)
+                raise
+            except Exception:
+                entry[0].close()
+                raise
+            else:
+                self._checkin(entry)
+
+    def sendmail(self, sender, recipients, message):
+        reused = False
+        try:
+            with self.connection() as (server, reused):
+                return server.sendmail(sender, recipients, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            if not reused:
+                raise
+        # The pooled session had been dropped by the server; retry once on a new one
+        with self.connection(fresh=True) as (server, _):
+            return server.sendmail(sender, recipients, message)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _, _ in idle:
+            self._quit(server)
+
+
+class Outbox:
+    def __init__(self, collection, smtp, workers=2, max_attempts=5, backoff=30, max_backoff=3600,
+                 lease=300, poll_interval=5.0):
+        # smtp: anything with sendmail(sender, recipients, message), normally an SMTPPool
+        self.collection = collection
+        self.smtp = smtp
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._jobs = []  # [interval, job, next run (monotonic)]
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def enqueue(self, sender, recipients, message, **extra):
+        # message is the full RFC 5322 text (e.g. MIMEMultipart.as_string())
+        now = datetime.now(timezone.utc)
+        doc = {
+            "sender": sender,
+            "recipients": list(recipients),
+            "message": message,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+            **extra
+        }
+        outbox_id = self.collection.insert_one(doc).inserted_id
+        self._wake.set()
+        return outbox_id
+
+    def claim(self):
+        # Take the oldest due message, or one whose sender died mid-delivery and let its lease lapse
+        now = datetime.now(timezone.utc)
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_expires_at": {"$lte": now}}
+            ]},
+            {"$set": {"status": "sending", "lease_expires_at": now + timedelta(seconds=self.lease)}},
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def send(self, doc):
+        self.smtp.sendmail(doc["sender"], doc["recipients"], doc["message"])
+
+    def deliver(self, doc):
+        try:
+            self.send(doc)
+        except Exception as e:
+            attempts = doc.get("attempts", 0) + 1
+            update = {"attempts": attempts, "last_error": str(e)}
+            if attempts >= self.max_attempts:
+                update["status"] = "failed"
+            else:
+                delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+                update["status"] = "pending"
+                update["next_attempt_at"] = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            self.collection.update_one({"_id": doc["_id"]}, {"$set": update, "$unset": {"lease_expires_at": ""}})
+            return False
+        self.collection.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"status": "sent", "sent_at": datetime.now(timezone.utc)},
+             "$inc": {"attempts": 1},
+             "$unset": {"lease_expires_at": "", "last_error": ""}}
+        )
+        return True
+
+    def every(self, interval, job):
+        # Call job() about every `interval` seconds while the workers run
+        self._jobs.append([interval, job, 0.0])
+
+    def run_due_jobs(self):
+        now = time.monotonic()
+        for entry in self._jobs:
+            if now >= entry[2]:
+                entry[2] = now + entry[0]
+                try:
+                    entry[1]()
+                except Exception:
+                    pass  # e.g. the database is briefly unreachable; the job runs again next interval
+
+    def deliver_due(self, limit=None):
+        # Drain whatever is due right now; returns the number of messages handled
+        handled = 0
+        while limit is None or handled < limit:
+            doc = self.claim()
+            if doc is None:
+                break
+            self.deliver(doc)
+            handled += 1
+        return handled
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, args=(i == 0,), name=f"outbox-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        with self._lock:
+            self._stopping.set()
+            self._wake.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+        if hasattr(self.smtp, "close"):
+            self.smtp.close()
+
+    @property
+    def running(self):
+        return bool(self._threads)
+
+    def _run(self, runs_jobs=False):
+        while not self._stopping.is_set():
+            if runs_jobs:
+                self.run_due_jobs()
+            try:
+                handled = self.deliver_due()
+            except Exception:
+                handled = 0  # e.g. the database is briefly unreachable; try again on the next tick
+            if not handled:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
@@ -0,0 +1,88 @@
+"""Password hashing with scrypt, tuned to a target latency.
+
+Hashes are stored as "scrypt$<n>$<r>$<p>$<salt>$<hash>" (salt and hash in base64), so
+the parameters travel with each record and can be raised later without breaking
+existing logins. verify() reports that a record needs rehashing when its cost is below
+the current one. Records that do not carry the prefix are legacy plaintext; they still
+verify, and always need rehashing.
+
+scrypt releases the GIL while it runs, so hashing happens on a small dedicated thread
+pool. Request threads wait on it without holding the interpreter, and the pool size
+caps how many cores a burst of logins can take away from the rest of the app.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PREFIX = "scrypt"
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password, salt, n, r, p, dklen=32):
+    # OpenSSL refuses anything over maxmem (32 MB by default), so size it for the parameters
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=dklen, maxmem=256 * r * n + 1024 * 1024)
+
+
+def calibrate(target_ms=50, r=8, p=1, min_n=2 ** 14, max_n=2 ** 20):
+    # Largest power-of-two n whose hash still fits the target on this machine
+    n = min_n
+    while n < max_n:
+        start = time.perf_counter()
+        _scrypt("calibration", b"0" * 16, n * 2, r, p)
+        if (time.perf_counter() - start) * 1000 > target_ms:
+            break
+        n *= 2
+    return n
+
+
+class PasswordHasher:
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=None):
+        self.n = n
+        self.r = r
+        self.p = p
+        self._pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="password-hash")
+
+    @classmethod
+    def calibrated(cls, target_ms=50, workers=None):
+        return cls(n=calibrate(target_ms), workers=workers)
+
+    def _hash(self, password):
+        salt = os.urandom(16)
+        digest = _scrypt(password, salt, self.n, self.r, self.p)
+        return f"{PREFIX}${self.n}${self.r}${self.p}${_b64(salt)}${_b64(digest)}"
+
+    def _verify(self, stored, password):
+        if not isinstance(password, str):
+            return False, False
+        if stored is None:
+            # Unknown account: spend the same time as a real check so the response does not give it away
+            _scrypt(password, b"\0" * 16, self.n, self.r, self.p)
+            return False, False
+        if not isinstance(stored, str):
+            return False, False
+        if not stored.startswith(PREFIX + "$"):
+            # Legacy plaintext record
+            return hmac.compare_digest(stored.encode(), password.encode()), True
+        try:
+            _, n, r, p, salt, digest = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+        except ValueError:
+            return False, False
+        ok = hmac.compare_digest(_scrypt(password, salt, n, r, p, len(digest)), digest)
+        # Only upgrade weaker records; a hash made with a higher n (e.g. calibrated on a faster
+        # machine) is kept rather than rewritten at a lower cost on every login
+        return ok, ok and (n < self.n or (r, p) != (self.r, self.p))
+
+    def hash(self, password):
+        return self._pool.submit(self._hash, password).result()
+
+    def verify(self, stored, password):
+        # Returns (matches, needs_rehash); stored=None stands for an unknown account
+        return self._pool.submit(self._verify, stored, password).result()
@@ -0,0 +1,68 @@
+"""Token-bucket rate limiting for the authentication routes.
+
+A bucket holds `burst` tokens and refills at burst / period tokens per second. It is
+stored as one number per key, the time at which the bucket would be full again (the
+"theoretical arrival time" of GCRA, which is an exact token bucket). A request is
+allowed while that time is less than a full period ahead of now, and each allowed
+request pushes it back by one token's worth of refill.
+
+MemoryRateLimiter keeps the buckets in the process. MongoRateLimiter keeps them in a
+collection so every worker shares them; both of its updates are single atomic
+operations, so concurrent workers never hand out the same token twice.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+
+class MemoryRateLimiter:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> time the bucket is full again
+        self._lock = threading.Lock()
+
+    def hit(self, key, burst, period):
+        # Take one token; returns (allowed, seconds until a token is available)
+        interval = period / burst
+        now = time.time()
+        with self._lock:
+            full_at = max(self._buckets.get(key, now), now)
+            if full_at + interval - now > period:
+                return False, full_at + interval - now - period
+            self._buckets[key] = full_at + interval
+            if len(self._buckets) > self.max_keys:
+                self._buckets = {k: v for k, v in self._buckets.items() if v > now}
+        return True, 0
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class MongoRateLimiter:
+    def __init__(self, collection):
+        # collection wants a TTL index on expires_at so idle buckets are dropped
+        self.collection = collection
+
+    def hit(self, key, burst, period):
+        interval = period / burst
+        now = time.time()
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=period)
+        try:
+            # Bucket already full (or new): start it over with one token taken
+            self.collection.update_one({"_id": key, "full_at": {"$lte": now}},
+                                       {"$set": {"full_at": now + interval, "expires_at": expires_at}},
+                                       upsert=True)
+            return True, 0
+        except DuplicateKeyError:
+            pass  # the bucket exists and is partly drained
+        if self.collection.update_one({"_id": key, "full_at": {"$lte": now + period - interval}},
+                                      {"$inc": {"full_at": interval}, "$set": {"expires_at": expires_at}}).modified_count:
+            return True, 0
+        doc = self.collection.find_one({"_id": key}, {"full_at": 1})
+        return False, max(doc["full_at"] + interval - now - period, 0) if doc else interval
+
+    def reset(self):
+        self.collection.delete_many({})
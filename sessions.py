@@ -0,0 +1,133 @@
+"""Server-side Flask sessions stored in a Mongo collection.
+
+The cookie carries only a random session id. The session data lives in the collection,
+keyed by a hash of that id, with a TTL index on expires_at. The collection also records
+the logged-in user id, so every session of an account can be revoked at once.
+
+Reads go through a small in-process cache. Most requests (role checks, page views)
+therefore cost no database round trip, and the cookie is only sent when a session is
+created or replaced. A revocation is seen immediately by the process that made it;
+other processes see it once their cached copy is older than cache_ttl seconds.
+"""
+import copy
+import hashlib
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+def _key(sid):
+    return hashlib.sha256(sid.encode()).hexdigest()
+
+
+def _aware(dt):
+    # pymongo hands datetimes back naive (in UTC) unless the client is tz_aware
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+class MongoSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, user_id=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.user_id = user_id  # the user the stored copy belongs to
+        self.expires_at = expires_at
+        self.modified = False
+
+
+class MongoSessionInterface(SessionInterface):
+    def __init__(self, collection, cache_ttl=5, cache_size=10000, refresh_after=3600):
+        # refresh_after: seconds between expiry extensions for a session that is only being read
+        self.collection = collection
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.refresh_after = refresh_after
+        self._cache = {}  # key -> (data, user_id, expires_at, cached_at)
+        self._lock = threading.Lock()
+
+    def _cache_put(self, key, data, user_id, expires_at):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache = {k: v for k, v in self._cache.items() if now - v[3] <= self.cache_ttl}
+                if len(self._cache) >= self.cache_size:
+                    self._cache.clear()
+            self._cache[key] = (copy.deepcopy(data), user_id, expires_at, now)
+
+    def _cache_drop(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def _load(self, key):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and now - cached[3] <= self.cache_ttl and cached[2] > datetime.now(timezone.utc):
+            return copy.deepcopy(cached[0]), cached[1], cached[2]
+        doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        if doc is None:
+            self._cache_drop(key)
+            return None
+        expires_at = _aware(doc["expires_at"])
+        self._cache_put(key, doc["data"], doc.get("user_id"), expires_at)
+        return doc["data"], doc.get("user_id"), expires_at
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            loaded = self._load(_key(sid))
+            if loaded is not None:
+                data, user_id, expires_at = loaded
+                return MongoSession(data, sid=sid, user_id=user_id, expires_at=expires_at)
+        return MongoSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.collection.delete_one({"_id": _key(session.sid)})
+                self._cache_drop(_key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = datetime.now(timezone.utc)
+        expires_at = now + app.permanent_session_lifetime
+        user_id = session.get("id")
+        set_cookie = session.new
+        if session.modified:
+            if not session.new and user_id != session.user_id:
+                # Logging in (or out) gets a fresh id so a planted or leaked one is worthless afterwards
+                self.collection.delete_one({"_id": _key(session.sid)})
+                self._cache_drop(_key(session.sid))
+                session.sid = secrets.token_urlsafe(32)
+                set_cookie = True
+            key = _key(session.sid)
+            data = dict(session)
+            self.collection.replace_one({"_id": key}, {"_id": key, "data": data, "user_id": user_id,
+                                                       "expires_at": expires_at}, upsert=True)
+            self._cache_put(key, data, user_id, expires_at)
+        elif session.expires_at and expires_at - session.expires_at > timedelta(seconds=self.refresh_after):
+            key = _key(session.sid)
+            self.collection.update_one({"_id": key}, {"$set": {"expires_at": expires_at}})
+            self._cache_put(key, dict(session), user_id, expires_at)
+            set_cookie = session.permanent
+
+        if set_cookie:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+        response.vary.add("Cookie")
+
+    def revoke_user(self, user_id):
+        # End every session of the account, e.g. when an admin deletes it
+        self.collection.delete_many({"user_id": user_id})
+        with self._lock:
+            self._cache = {k: v for k, v in self._cache.items() if v[1] != user_id}
@@ -0,0 +1,205 @@
+import itertools
+import random
+
+import pytest
+from app import app, db, allotment_input, apply_allotment, faculty_constraints, AllotmentConflict
+from allotment import blocking_pairs, choice_counts, optimal_match, stable_match
+
+
+def test_textbook_instance():
+    student_prefs = {'a': ['X', 'Y'], 'b': ['X', 'Y'], 'c': ['X']}
+    project_ranks = {'X': {'c': 0, 'a': 1, 'b': 2}, 'Y': {'a': 0, 'b': 1}}
+    matching = stable_match(student_prefs, project_ranks, {'X': 1, 'Y': 1})
+    assert matching == {'c': 'X', 'a': 'Y'}
+    assert blocking_pairs(matching, student_prefs, project_ranks, {'X': 1, 'Y': 1}) == []
+
+
+def test_capacities_and_acceptability():
+    student_prefs = {'a': ['X'], 'b': ['X'], 'c': ['X', 'Z'], 'd': ['Y']}
+    project_ranks = {'X': {'a': 0, 'b': 1, 'c': 2}, 'Z': {'c': 0}, 'Y': {}}  # Y does not accept d
+    matching = stable_match(student_prefs, project_ranks, {'X': 2, 'Z': None, 'Y': 3})
+    assert matching == {'a': 'X', 'b': 'X', 'c': 'Z'}
+
+
+def test_random_instances_are_stable():
+    rng = random.Random(7)
+    for _ in range(50):
+        projects = [f'P{i}' for i in range(rng.randint(1, 8))]
+        student_prefs = {f'S{i}': rng.sample(projects, rng.randint(1, len(projects))) for i in range(rng.randint(1, 30))}
+        project_ranks = {}
+        for student, prefs in student_prefs.items():
+            for project in prefs:
+                if rng.random() < 0.9:
+                    project_ranks.setdefault(project, {})[student] = rng.random()
+        capacities = {project: rng.choice([0, 1, 2, 3, None]) for project in projects}
+        matching = stable_match(student_prefs, project_ranks, capacities)
+        assert blocking_pairs(matching, student_prefs, project_ranks, capacities) == []
+        for project, seats in capacities.items():
+            if seats is not None:
+                assert list(matching.values()).count(project) <= seats
+
+
+def test_optimal_places_more_students_than_stable():
+    # X prefers a, but giving a their second choice lets b in as well
+    student_prefs = {'a': ['X', 'Y'], 'b': ['X']}
+    project_ranks = {'X': {'a': 0, 'b': 1}, 'Y': {'a': 0}}
+    capacities = {'X': 1, 'Y': 1}
+    assert stable_match(student_prefs, project_ranks, capacities) == {'a': 'X'}
+    matching = optimal_match(student_prefs, project_ranks, capacities)
+    assert matching == {'a': 'Y', 'b': 'X'}
+    assert choice_counts(matching, student_prefs) == [1, 1]
+
+
+def test_optimal_prefers_earlier_choices():
+    student_prefs = {'a': ['X', 'Y'], 'b': ['Y', 'X']}
+    project_ranks = {'X': {'a': 0, 'b': 0}, 'Y': {'a': 0, 'b': 0}}
+    assert optimal_match(student_prefs, project_ranks, {'X': 1, 'Y': 1}) == {'a': 'X', 'b': 'Y'}
+
+
+def test_optimal_faculty_limits():
+    student_prefs = {'a': ['X'], 'b': ['Y'], 'c': ['Z', 'X']}
+    project_ranks = {'X': {'a': 0, 'c': 0}, 'Y': {'b': 0}, 'Z': {'c': 0}}
+    capacities = {'X': None, 'Y': 2, 'Z': 1}
+    guides = {'X': 'g1', 'Y': 'g1', 'Z': 'g2'}
+    matching = optimal_match(student_prefs, project_ranks, capacities, guides, {'g1': 2, 'g2': 0})
+    assert matching == {'a': 'X', 'b': 'Y'}
+
+    # g2 co-guides c on X, which counts against g2's limit too
+    matching = optimal_match(student_prefs, project_ranks, capacities, guides, {'g1': 3, 'g2': 0},
+                             co_guides={('c', 'X'): 'g2'})
+    assert matching == {'a': 'X', 'b': 'Y'}
+    matching = optimal_match(student_prefs, project_ranks, capacities, guides, {'g1': 3, 'g2': 1},
+                             co_guides={('c', 'X'): 'g2'})
+    assert matching == {'a': 'X', 'b': 'Y', 'c': 'Z'}
+
+
+def test_optimal_is_optimal_on_random_instances():
+    rng = random.Random(11)
+    for _ in range(100):
+        projects = [f'P{i}' for i in range(rng.randint(1, 4))]
+        students = [f'S{i}' for i in range(rng.randint(1, 6))]
+        student_prefs = {s: rng.sample(projects, rng.randint(1, len(projects))) for s in students}
+        project_ranks = {p: {s: 0 for s in students if p in student_prefs[s] and rng.random() < 0.9} for p in projects}
+        capacities = {p: rng.choice([0, 1, 2, None]) for p in projects}
+        guides = {p: rng.choice(['g1', 'g2']) for p in projects}
+        limits = {g: rng.randint(1, 3) for g in ('g1', 'g2') if rng.random() < 0.7}
+
+        best = None
+        options = [[None] + [p for p in student_prefs[s] if s in project_ranks[p]] for s in students]
+        for combo in itertools.product(*options):
+            taken = [p for p in combo if p is not None]
+            if any(capacities[p] is not None and taken.count(p) > capacities[p] for p in taken):
+                continue
+            if any(sum(guides[p] == g for p in taken) > limit for g, limit in limits.items()):
+                continue
+            score = (len(taken), -sum(student_prefs[s].index(p) for s, p in zip(students, combo) if p))
+            best = max(best or score, score)
+
+        matching = optimal_match(student_prefs, project_ranks, capacities, guides, limits)
+        counts = choice_counts(matching, student_prefs)
+        assert (len(matching), -sum(position * count for position, count in enumerate(counts))) == best
+
+
+@pytest.fixture
+def allotment_data():
+    roll_nos = ['allot1', 'allot2', 'allot3', 'allot4']
+    btp_ids = ['82001', '82002', '82003']
+    db.application.delete_many({'$or': [{'roll_no': {'$in': roll_nos}}, {'btp_id': {'$in': btp_ids}}]})
+    db.btp_list.delete_many({'btp_id': {'$in': btp_ids}})
+    db.btp_list.insert_many([
+        {'btp_id': '82001', 'btp_name': 'A', 'prof_id': 'g1', 'capacity': 1, 'seats_left': 1},
+        {'btp_id': '82002', 'btp_name': 'B', 'prof_id': 'g2', 'capacity': 2, 'seats_left': 2},
+        {'btp_id': '82003', 'btp_name': 'C', 'prof_id': 'g3'}  # no capacity: unlimited
+    ])
+    db.application.insert_many([
+        {'btp_id': '82001', 'roll_no': 'allot1', 'status': 'Approved', 'preference': 1, 'guide_rank': 2},
+        {'btp_id': '82002', 'roll_no': 'allot1', 'status': 'Approved', 'preference': 2},
+        {'btp_id': '82001', 'roll_no': 'allot2', 'status': 'Approved', 'preference': 1, 'guide_rank': 1},
+        {'btp_id': '82003', 'roll_no': 'allot2', 'status': 'Approved', 'preference': 2},
+        {'btp_id': '82002', 'roll_no': 'allot3', 'status': 'Pending', 'preference': 1},  # not approved by the guide
+        {'btp_id': '82002', 'roll_no': 'allot4', 'status': 'Approved'},
+        {'btp_id': '82003', 'roll_no': 'allot4', 'status': 'Confirmed'}  # already settled
+    ])
+    yield
+    db.application.delete_many({'roll_no': {'$in': roll_nos}})
+    db.btp_list.delete_many({'btp_id': {'$in': btp_ids}})
+
+
+def test_allotment_from_applications(allotment_data):
+    app.config['TESTING'] = True
+    student_prefs, project_ranks, capacities, application_ids = allotment_input()
+    assert student_prefs['allot1'] == ['82001', '82002']
+    assert 'allot3' not in student_prefs and 'allot4' not in student_prefs
+    assert (capacities['82001'], capacities['82003']) == (1, None)
+
+    # only write this fixture's students; other tests leave approved applications in the shared database
+    matching = {roll_no: btp_id for roll_no, btp_id in stable_match(student_prefs, project_ranks, capacities).items()
+                if roll_no.startswith('allot')}
+    assert matching['allot2'] == '82001'  # the guide ranked allot2 first
+    assert matching['allot1'] == '82002'
+    assert apply_allotment(matching, application_ids, capacities) == 2
+
+    statuses = {(a['roll_no'], a['btp_id']): a['status'] for a in db.application.find({'roll_no': {'$in': ['allot1', 'allot2']}})}
+    assert statuses[('allot1', '82002')] == statuses[('allot2', '82001')] == 'Temporarily Confirmed'
+    assert statuses[('allot1', '82001')] == statuses[('allot2', '82003')] == 'Approved'
+    seats = {p['btp_id']: p.get('seats_left') for p in db.btp_list.find({'btp_id': {'$in': ['82001', '82002']}})}
+    assert seats == {'82001': 0, '82002': 1}
+
+
+def test_allotment_detects_concurrent_changes(allotment_data):
+    student_prefs, project_ranks, capacities, application_ids = allotment_input()
+    matching = {roll_no: btp_id for roll_no, btp_id in stable_match(student_prefs, project_ranks, capacities).items()
+                if roll_no.startswith('allot')}
+    db.btp_list.update_one({'btp_id': '82001'}, {'$set': {'seats_left': 0}})  # seat taken meanwhile
+    with pytest.raises(AllotmentConflict):
+        apply_allotment(matching, application_ids, capacities)
+
+
+def test_faculty_constraints(allotment_data):
+    db.users.delete_many({'id': {'$in': ['g1', 'g2', 'g3', 'cg1']}})
+    co_guide = db.users.insert_one({'id': 'cg1', 'role': 'faculty', 'max_students': 1}).inserted_id
+    db.users.insert_many([{'id': 'g1', 'role': 'faculty', 'max_students': 3}, {'id': 'g2', 'role': 'faculty'},
+                          {'id': 'g3', 'role': 'faculty', 'max_students': 1}])
+    application = db.application.find_one({'roll_no': 'allot2', 'btp_id': '82003'})
+    db.co_guides_selected.insert_one({'application_id': application['_id'], 'co_guide_id': str(co_guide),
+                                      'status': 'Approved'})
+    try:
+        app.config['GUIDE_CAPACITY'] = 4
+        student_prefs, project_ranks, capacities, application_ids = allotment_input()
+        project_guides, co_guides, faculty_capacities = faculty_constraints(application_ids)
+        # other tests leave settled applications behind, so only look at this fixture's projects and faculty
+        assert {btp_id: project_guides[btp_id] for btp_id in ('82001', '82002', '82003')} == \
+            {'82001': 'g1', '82002': 'g2', '82003': 'g3'}
+        assert {key: co_guide for key, co_guide in co_guides.items() if key[0].startswith('allot')} == \
+            {('allot2', '82003'): 'cg1'}
+        # allot4's confirmed application on 82003 already uses g3's only seat
+        assert {member: faculty_capacities[member] for member in ('g1', 'g2', 'g3', 'cg1')} == \
+            {'g1': 3, 'g2': 4, 'g3': 0, 'cg1': 1}
+
+        matching = optimal_match(student_prefs, project_ranks, capacities, project_guides, faculty_capacities,
+                                 co_guides)
+        assert {roll_no: matching[roll_no] for roll_no in ('allot1', 'allot2')} == {'allot1': '82002', 'allot2': '82001'}
+    finally:
+        app.config['GUIDE_CAPACITY'] = None
+        db.users.delete_many({'id': {'$in': ['g1', 'g2', 'g3', 'cg1']}})
+        db.co_guides_selected.delete_many({'application_id': application['_id']})
+
+
+def test_allotment_without_transactions_undoes_a_conflict(allotment_data):
+    student_prefs, project_ranks, capacities, application_ids = allotment_input()
+    matching = {roll_no: btp_id for roll_no, btp_id in stable_match(student_prefs, project_ranks, capacities).items()
+                if roll_no.startswith('allot')}
+    db.btp_list.update_one({'btp_id': '82001'}, {'$set': {'seats_left': 0}})  # seat taken meanwhile
+    app.config['MONGO_TRANSACTIONS'] = False
+    try:
+        with pytest.raises(AllotmentConflict):
+            apply_allotment(matching, application_ids, capacities)
+    finally:
+        app.config['MONGO_TRANSACTIONS'] = True
+
+    # the applications and the seat already written are given back
+    statuses = {a['status'] for a in db.application.find({'roll_no': {'$in': ['allot1', 'allot2']}})}
+    assert statuses == {'Approved'}
+    assert db.application.count_documents({'allotment_batch': {'$exists': True}}) == 0
+    seats = {p['btp_id']: p['seats_left'] for p in db.btp_list.find({'btp_id': {'$in': ['82001', '82002']}})}
+    assert seats == {'82001': 0, '82002': 2}
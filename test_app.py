@@ -1,10 +1,13 @@
 import pytest
-from app import app, db
+from app import app, db, verifications, rate_limiter, password_hasher
+from flask import g
 from bson import ObjectId
+import hashlib
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
+    rate_limiter.reset()  # every test starts with full buckets
     client = app.test_client()
 
     yield client
@@ -83,9 +86,9 @@ def test_verify_otp_forgot_password_page(client):
 
 def test_verify_otp_forgot_password_post(client):
     # Simulate session setup for OTP verification
+    token = verifications.create('reset_password', '123456', email='testuser@iitkgp.ac.in')
     with client.session_transaction() as sess:
-        sess['otp'] = '123456'
-        sess['email'] = 'testuser@iitkgp.ac.in'
+        sess['reset_token'] = token
 
     response = client.post('/verify_otp_forgot_password', data={
         'otp': '123456'
@@ -287,6 +290,80 @@ def test_btp_list_student_with_approved_application(client):
     assert b'Test Project' in response.data
     assert b'Dr. Test Faculty' in response.data
 
+def test_btp_list_student_with_confirmed_application(client):
+    # Simulate student login
+    with client.session_transaction() as sess:
+        sess['id'] = 'student789'
+        sess['role'] = 'student'
+
+    db.btp_list.delete_many({'btp_id': {'$in': ['54321', '54322']}})
+    db.btp_list.insert_many([
+        {'btp_id': '54321', 'btp_name': 'Test Project', 'prof_id': 'faculty123'},
+        {'btp_id': '54322', 'btp_name': 'Other Project', 'prof_id': 'faculty123'}
+    ])
+
+    db.users.delete_many({'id': 'faculty123'})
+    db.users.insert_one({
+        'id': 'faculty123',
+        'full_name': 'Dr. Test Faculty',
+        'email': 'faculty@example.com',
+        'department': 'CSE'
+    })
+
+    # Another student's application must not leak into this student's view
+    db.application.delete_many({'btp_id': {'$in': ['54321', '54322']}})
+    db.application.insert_many([
+        {'btp_id': '54321', 'roll_no': 'student789', 'status': 'Confirmed'},
+        {'btp_id': '54322', 'roll_no': 'student456', 'status': 'Pending'}
+    ])
+
+    response = client.get('/btp_list')
+    assert response.status_code == 200
+    assert b'Other Project' in response.data
+    assert b'<button disabled>Confirmed</button>' in response.data
+    assert b'<button disabled>Pending</button>' not in response.data
+    assert b'<button type="submit">Apply</button>' not in response.data  # flag is 0 once confirmed
+
+def test_btp_list_pagination_and_filters(client):
+    import re
+    with client.session_transaction() as sess:
+        sess['id'] = 'faculty123'
+        sess['role'] = 'faculty'
+
+    db.users.delete_many({'id': {'$in': ['pagefac1', 'pagefac2']}})
+    db.users.insert_many([
+        {'id': 'pagefac1', 'full_name': 'Paging Faculty', 'role': 'faculty', 'department': 'PAGING'},
+        {'id': 'pagefac2', 'full_name': 'Other Faculty', 'role': 'faculty', 'department': 'OTHER'}
+    ])
+    db.btp_list.delete_many({'btp_id': {'$in': ['60001', '60002', '60003', '60004']}})
+    db.btp_list.insert_many([
+        {'btp_id': '60001', 'btp_name': 'Paged One', 'prof_id': 'pagefac1'},
+        {'btp_id': '60002', 'btp_name': 'Paged Two', 'prof_id': 'pagefac1'},
+        {'btp_id': '60003', 'btp_name': 'Paged Three', 'prof_id': 'pagefac1'},
+        {'btp_id': '60004', 'btp_name': 'Paged Elsewhere', 'prof_id': 'pagefac2'}
+    ])
+
+    response = client.get('/btp_list?department=PAGING&per_page=2')
+    assert response.status_code == 200
+    assert b'Paged One' in response.data and b'Paged Two' in response.data
+    assert b'Paged Three' not in response.data
+    assert b'Paged Elsewhere' not in response.data
+    next_link = re.search(rb'href="([^"]*after=[^"]*)"', response.data).group(1).decode().replace('&amp;', '&')
+
+    response = client.get(next_link)
+    assert b'Paged Three' in response.data
+    assert b'Paged One' not in response.data
+    assert b'after=' not in response.data
+    prev_link = re.search(rb'href="([^"]*before=[^"]*)"', response.data).group(1).decode().replace('&amp;', '&')
+
+    response = client.get(prev_link)
+    assert b'Paged One' in response.data and b'Paged Two' in response.data
+    assert b'Paged Three' not in response.data
+
+    response = client.get('/btp_list?prof_id=pagefac1&order=desc&per_page=1')
+    assert b'Paged Three' in response.data
+    assert b'Paged Two' not in response.data
+
 def test_upload_project(client):
     response = client.post('/upload_project', data=dict(
         btp_name='Test Project'), follow_redirects=True)
@@ -1004,8 +1081,11 @@ def test_confirm_project_unauthorized(client):
 # Example of testing POST request with form data
 def test_send_applications_to_co_guides_route(client):
     """Test send applications to co-guides route (POST request)."""
-    # Assuming session with faculty role and a valid application_id
-    application_id = '60f07633f95cc217a6c628ab'  # Replace with a valid application_id
+    # Assuming session with faculty role and an application waiting for co-guides
+    application_id = '60f07633f95cc217a6c628ab'
+    db.application.delete_many({'_id': ObjectId(application_id)})
+    db.application.insert_one({'_id': ObjectId(application_id), 'btp_id': '12345', 'roll_no': 'student123',
+                               'status': 'Approved by Guide'})
     with client.session_transaction() as sess:
         sess['role'] = 'faculty'
     response = client.post(f'/send_applications_to_co_guides/{application_id}', data={
@@ -1276,15 +1356,12 @@ def test_verify_otp_signup_page(client):
     assert response.status_code == 200
 
 def test_verify_otp_signup_post(client):
-    # Simulate signup to set session variables
-    with client.session_transaction() as sess:
-        sess['otp'] = '123456'
-        sess['email'] = 'testuser@iitkgp.ac.in'
-        sess['id'] = '123456789'
-        sess['password'] = 'password123'
-        sess['full_name'] = 'Test User'
-        sess['department'] = 'CSE'
-        sess['role'] = 'student'
+    # Simulate signup to leave a pending verification behind
+    db.users.delete_many({'id': '123456789'})
+    token = verifications.create('signup', '123456', id='123456789', password='password123', full_name='Test User',
+                                 email='testuser@iitkgp.ac.in', department='CSE', role='student')
+    with client.session_transaction() as sess:
+        sess['signup_token'] = token
 
     response = client.post('/verify_otp_signup', data={
         'otp': '123456'
@@ -1320,6 +1397,7 @@ from app import send_otp_signup
 def test_signup_and_verify(client):
     # Test signup route
     db.users.delete_many({'id': '123456789'})
+    db.users.delete_many({'email': 'teststudent@iitkgp.com'})
     signup_data = {
         'id': '123456789',
         'password': 'testpassword',
@@ -1327,29 +1405,22 @@ def test_signup_and_verify(client):
         'email': 'teststudent@iitkgp.com',
         'department': 'CSE'
     }
-    with client.session_transaction() as sess:
-        # Mocking session data for signup
-        sess['otp'] = 123456
-        sess['email'] = signup_data['email']
-        sess['id'] = signup_data['id']
-        sess['password'] = signup_data['password']
-        sess['full_name'] = signup_data['full_name']
-        sess['department'] = signup_data['department']
-        sess['role'] = 'student'
-
-    # Send mock OTP (normally done by send_otp_signup, mocked here)
-    send_otp_signup(sess['otp'], sess['email'])
 
     # Simulate POST request to signup route
-    response = client.post('/signup', data=signup_data, follow_redirects=True)
+    response = client.post('/signup', data=signup_data)
+    assert response.status_code == 302
 
-    # Assertions for signup route
-    # assert b'An OTP has been sent to your email address.' in response.data
-    assert sess.get('otp') is not None
+    # Only the opaque token travels in the cookie
+    with client.session_transaction() as sess:
+        assert set(sess.keys()) - {'_flashes'} == {'signup_token'}
+
+    # Read the OTP back from the queued mail
+    queued = db.outbox.find_one({'recipients': signup_data['email']}, sort=[('created_at', -1)])
+    otp = queued['message'].split('OTP: ')[1].split()[0]
 
     # Test verify_otp_signup route
     otp_data = {
-        'otp': sess['otp']
+        'otp': otp
     }
     response = client.post('/verify_otp_signup', data=otp_data, follow_redirects=True)
 
@@ -1433,10 +1504,11 @@ def test_reset_password(client):
         "password": "oldpassword"
     })
 
-    # Simulate a session with email and OTP
+    # Simulate a session whose OTP has already been verified
+    token = verifications.create('reset_password', '123456', email='test@example.com')
+    verifications.verify(token, 'reset_password', '123456', consume=False)
     with client.session_transaction() as session:
-        session['email'] = 'test@example.com'
-        session['otp'] = '123456'  # Assuming OTP verification is done separately
+        session['reset_token'] = token
 
     # Test password reset with matching passwords
     response = client.post('/reset_password', data={
@@ -1449,7 +1521,7 @@ def test_reset_password(client):
 
     # Verify that the password has been updated in the database
     user = db.users.find_one({"email": "test@example.com"})
-    assert user['password'] == 'newpassword'
+    assert password_hasher.verify(user['password'], 'newpassword') == (True, False)
 
     # Test password reset with non-matching passwords
     response = client.post('/reset_password', data={
@@ -1461,8 +1533,830 @@ def test_reset_password(client):
 
     # Clean up the session
     with client.session_transaction() as session:
-        session.pop('email', None)
-        session.pop('otp', None)
+        session.pop('reset_token', None)
+
+from app import ensure_indexes, _has_collscan, _winning_plans
+
+def test_ensure_indexes_is_idempotent():
+    test_db = db.client['btp_index_test']
+    test_db.users.drop()
+    try:
+        created, failed = ensure_indexes(test_db)
+        assert failed == []
+        assert 'users.id_1' in created
+        assert 'application.btp_id_1_roll_no_1' in created
+
+        # Running it again must not fail or duplicate anything
+        created_again, failed = ensure_indexes(test_db)
+        assert failed == []
+        assert created_again == created
+        assert test_db.users.index_information()['id_1']['unique'] is True
+    finally:
+        db.client.drop_database('btp_index_test')
+
+def test_ensure_indexes_reports_duplicate_data():
+    test_db = db.client['btp_index_test']
+    test_db.users.insert_many([{'id': 'dup'}, {'id': 'dup'}])
+    try:
+        created, failed = ensure_indexes(test_db)
+        assert [(collection, keys[0][0]) for collection, keys, _ in failed] == [('users', 'id')]
+        assert 'users.email_1' in created
+    finally:
+        db.client.drop_database('btp_index_test')
+
+def test_collscan_detection():
+    explain = {
+        'queryPlanner': {
+            'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'id_1'}},
+            'rejectedPlans': [{'stage': 'COLLSCAN'}]
+        }
+    }
+    assert not any(_has_collscan(plan) for plan in _winning_plans(explain))
+
+    explain['queryPlanner']['winningPlan'] = {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}
+    assert any(_has_collscan(plan) for plan in _winning_plans(explain))
+
+from app import UserLoader, user_loader
+
+def test_user_loader_batches_and_memoises():
+    db.users.delete_many({'id': {'$in': ['loader1', 'loader2']}})
+    db.users.insert_many([
+        {'id': 'loader1', 'full_name': 'Loader One', 'password': 'secret'},
+        {'id': 'loader2', 'full_name': 'Loader Two', 'password': 'secret'}
+    ])
+    second_oid = db.users.find_one({'id': 'loader2'})['_id']
+
+    loader = UserLoader(db.users)
+    loader.prime(ids=['loader1', 'missing'], oids=[str(second_oid), 'not-an-object-id'])
+    assert loader.get('loader1')['full_name'] == 'Loader One'
+    assert loader.get_by_oid(second_oid)['full_name'] == 'Loader Two'
+    assert loader.get('missing') is None
+    assert loader.get('loader2')['full_name'] == 'Loader Two'  # filled in by the _id lookup
+    assert 'password' not in loader.get('loader1')
+    assert loader.queries == 1
+
+def test_user_loader_is_request_scoped():
+    with app.test_request_context():
+        assert user_loader() is user_loader()
+        first = user_loader()
+    with app.test_request_context():
+        assert user_loader() is not first
+
+def test_approved_list_constant_user_queries(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'loaderfac'
+        sess['role'] = 'faculty'
+
+    roll_nos = [f'loadstu{i}' for i in range(5)]
+    db.users.delete_many({'id': {'$in': roll_nos}})
+    db.users.insert_many([{'id': r, 'full_name': f'Loader Student {r}', 'department': 'CSE'} for r in roll_nos])
+    db.btp_list.delete_many({'btp_id': {'$in': ['70001', '70002']}})
+    db.btp_list.insert_many([
+        {'btp_id': '70001', 'btp_name': 'Loader Project A', 'prof_id': 'loaderfac'},
+        {'btp_id': '70002', 'btp_name': 'Loader Project B', 'prof_id': 'loaderfac'}
+    ])
+    db.application.delete_many({'btp_id': {'$in': ['70001', '70002']}})
+    db.application.insert_many([{'btp_id': '70001' if i % 2 else '70002', 'roll_no': r, 'status': 'Approved'}
+                                for i, r in enumerate(roll_nos)])
+
+    with client:
+        response = client.get('/approved_list')
+        assert response.status_code == 200
+        assert g.user_loader.queries == 1
+    for r in roll_nos:
+        assert f'Loader Student {r}'.encode() in response.data
+
+def test_application_list_groups_by_project(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'groupfac'
+        sess['role'] = 'faculty'
+
+    db.users.delete_many({'id': {'$in': ['groupstu1', 'groupstu2']}})
+    db.users.insert_many([
+        {'id': 'groupstu1', 'full_name': 'Group Student One', 'email': 'one@test.com', 'department': 'CSE'},
+        {'id': 'groupstu2', 'full_name': 'Group Student Two', 'email': 'two@test.com'}
+    ])
+    db.btp_list.delete_many({'prof_id': 'groupfac'})
+    db.btp_list.insert_many([
+        {'btp_id': '71001', 'btp_name': 'Grouped A', 'prof_id': 'groupfac'},
+        {'btp_id': '71002', 'btp_name': 'Grouped B', 'prof_id': 'groupfac'},
+        {'btp_id': '71003', 'btp_name': 'Grouped Empty', 'prof_id': 'groupfac'}
+    ])
+    db.application.delete_many({'btp_id': {'$in': ['71001', '71002', '71003']}})
+    db.application.insert_many([
+        {'btp_id': '71001', 'roll_no': 'groupstu1', 'status': 'Pending'},
+        {'btp_id': '71002', 'roll_no': 'groupstu2', 'status': 'Approved'},
+        {'btp_id': '71002', 'roll_no': 'groupghost', 'status': 'Pending'}
+    ])
+
+    with client:
+        response = client.get('/application_list')
+        assert response.status_code == 200
+        assert 'user_loader' not in g  # students are joined inside the aggregation
+    data = response.data
+    assert data.index(b'Grouped A') < data.index(b'Group Student One') < data.index(b'Grouped B')
+    assert data.index(b'Grouped B') < data.index(b'Group Student Two') < data.index(b'Grouped Empty')
+    assert b'groupghost' not in data
+    assert b'Unknown' in data  # groupstu2 has no department
+
+def test_bulk_application_approval(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'bulkfac'
+        sess['role'] = 'faculty'
+
+    db.users.delete_many({'id': {'$in': ['bulkfac', 'bulkother', 'bulkstu1', 'bulkstu2', 'bulkstu3']}})
+    db.users.insert_many([
+        {'id': 'bulkfac', 'full_name': 'Bulk Faculty', 'role': 'faculty', 'department': 'CSE'},
+        {'id': 'bulkother', 'full_name': 'Other Faculty', 'role': 'faculty', 'department': 'CSE'},
+        {'id': 'bulkstu1', 'full_name': 'Bulk One', 'department': 'CSE'},
+        {'id': 'bulkstu2', 'full_name': 'Bulk Two', 'department': 'ECE'},
+        {'id': 'bulkstu3', 'full_name': 'Bulk Three', 'department': 'CSE'}
+    ])
+    db.btp_list.delete_many({'btp_id': {'$in': ['72001', '72002']}})
+    db.btp_list.insert_many([
+        {'btp_id': '72001', 'btp_name': 'Bulk Project', 'prof_id': 'bulkfac'},
+        {'btp_id': '72002', 'btp_name': 'Not Mine', 'prof_id': 'bulkother'}
+    ])
+    db.application.delete_many({'btp_id': {'$in': ['72001', '72002']}})
+    same_dept = db.application.insert_one({'btp_id': '72001', 'roll_no': 'bulkstu1', 'status': 'Pending'}).inserted_id
+    other_dept = db.application.insert_one({'btp_id': '72001', 'roll_no': 'bulkstu2', 'status': 'Pending'}).inserted_id
+    already = db.application.insert_one({'btp_id': '72001', 'roll_no': 'bulkstu3', 'status': 'Approved'}).inserted_id
+    not_mine = db.application.insert_one({'btp_id': '72002', 'roll_no': 'bulkstu1', 'status': 'Pending'}).inserted_id
+    missing = ObjectId()
+
+    ids = [str(same_dept), str(other_dept), str(already), str(not_mine), str(missing), 'not-an-id']
+    response = client.post('/bulk_application_approval', data={'action': 'approve', 'application_ids[]': ids})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['modified_count'] == 1
+    outcomes = {r['application_id']: r['outcome'] for r in body['results']}
+    assert outcomes == {
+        str(same_dept): 'updated',
+        str(other_dept): 'needs_co_guide',
+        str(already): 'unchanged',
+        str(not_mine): 'not_authorized',
+        str(missing): 'not_found',
+        'not-an-id': 'invalid_id'
+    }
+    assert body['results'][1]['redirect'] == f'/select_co_guides/{other_dept}'
+    assert db.application.find_one({'_id': same_dept})['status'] == 'Approved'
+    assert db.application.find_one({'_id': other_dept})['status'] == 'Pending'
+    assert db.application.find_one({'_id': not_mine})['status'] == 'Pending'
+
+    response = client.post('/bulk_application_approval', json={'action': 'reject', 'application_ids': [str(same_dept)]})
+    assert response.get_json()['results'][0]['outcome'] == 'updated'
+    assert db.application.find_one({'_id': same_dept})['status'] == 'Pending'
+
+def test_bulk_application_approval_bad_request(client):
+    response = client.post('/bulk_application_approval', data={'action': 'approve'})
+    assert response.status_code == 401
+
+    with client.session_transaction() as sess:
+        sess['id'] = 'bulkfac'
+        sess['role'] = 'faculty'
+    response = client.post('/bulk_application_approval', data={'action': 'maybe', 'application_ids[]': [str(ObjectId())]})
+    assert response.status_code == 400
+
+from app import fs
+
+def test_file_download_streams_with_ranges(client):
+    content = bytes(range(256)) * 1024  # spans several GridFS chunks
+    file_id = fs.put(content, filename='report final.pdf', content_type='application/pdf')
+
+    response = client.get(f'/file/{file_id}')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers['Content-Length'] == str(len(content))
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Disposition'].startswith('inline; filename=report_final.pdf')
+    assert response.mimetype == 'application/pdf'
+    assert response.data == content
+
+    response = client.get(f'/file/{file_id}', headers={'Range': 'bytes=261000-261999'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 261000-261999/{len(content)}'
+    assert response.headers['Content-Length'] == '1000'
+    assert response.data == content[261000:262000]
+
+    response = client.get(f'/file/{file_id}', headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206
+    assert response.data == content[-10:]
+
+    response = client.get(f'/file/{file_id}', headers={'Range': f'bytes={len(content)}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(content)}'
+
+def test_file_download_missing(client):
+    assert client.get(f'/file/{ObjectId()}').status_code == 404
+    assert client.get('/file/not-an-id').status_code == 404
+
+def test_file_download_conditional_get(client):
+    file_id = fs.put(b'immutable report body', filename='report.pdf', content_type='application/pdf')
+
+    response = client.get(f'/file/{file_id}')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    # Stored without a sha256, so the validator falls back to id and upload time
+    assert etag.startswith(f'"{file_id}-')
+    last_modified = response.headers['Last-Modified']
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+
+    response = client.get(f'/file/{file_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    response = client.get(f'/file/{file_id}', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+    response = client.get(f'/file/{file_id}', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == b'immutable report body'
+
+    # A stale If-Range turns the range request into a full response
+    response = client.get(f'/file/{file_id}', headers={'Range': 'bytes=0-8', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    response = client.get(f'/file/{file_id}', headers={'Range': 'bytes=0-8', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == b'immutable'
+
+import io
+
+def test_submit_report_deduplicates_identical_uploads(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'dedupstu'
+        sess['role'] = 'student'
+
+    content = b'%PDF-1.4 final report ' * 50000  # larger than one upload chunk
+    db.btp_submission_collection.delete_many({'roll_no': 'dedupstu'})
+    response = client.post('/submit_report/73001/dedupstu',
+                           data={'report_file': (io.BytesIO(content), 'report.pdf')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    first = db.btp_submission_collection.find_one({'btp_id': '73001', 'roll_no': 'dedupstu'})['file_id']
+    stored = db.fs.files.find_one({'_id': first})
+    assert stored['length'] == len(content)
+    assert stored['metadata']['sha256'] == hashlib.sha256(content).hexdigest()
+    assert fs.get(first).read() == content
+
+    files_before = db.fs.files.count_documents({})
+    response = client.post('/submit_report/73001/dedupstu',
+                           data={'report_file': (io.BytesIO(content), 'report-v2.pdf')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert db.btp_submission_collection.find_one({'btp_id': '73001', 'roll_no': 'dedupstu'})['file_id'] == first
+    assert db.fs.files.count_documents({}) == files_before
+
+def test_submit_report_rejects_oversized_upload(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'dedupstu'
+        sess['role'] = 'student'
+
+    limit = app.config['MAX_UPLOAD_BYTES']
+    app.config['MAX_UPLOAD_BYTES'] = 1024
+    try:
+        files_before = db.fs.files.count_documents({})
+        response = client.post('/submit_report/73002/dedupstu',
+                               data={'report_file': (io.BytesIO(b'x' * 2048), 'big.pdf')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 302
+        assert response.headers['Location'] == '/submit_report/73002/dedupstu'
+        with client.session_transaction() as sess:
+            assert 'The file is too large' in sess['_flashes'][0][1]
+        assert db.fs.files.count_documents({}) == files_before
+        assert db.btp_submission_collection.find_one({'btp_id': '73002', 'roll_no': 'dedupstu'}) is None
+    finally:
+        app.config['MAX_UPLOAD_BYTES'] = limit
+
+def test_upload_project_with_file(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'uploadfac'
+        sess['role'] = 'faculty'
+
+    db.btp_list.delete_many({'prof_id': 'uploadfac'})
+    response = client.post('/upload_project',
+                           data={'btp_name': 'Uploaded Project',
+                                 'project_file': (io.BytesIO(b'project brief'), 'brief.pdf', 'application/pdf')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    project = db.btp_list.find_one({'prof_id': 'uploadfac'})
+    assert fs.get(project['project_file_id']).read() == b'project brief'
+
+    # The same brief on another of this professor's projects reuses the stored file
+    files_before = db.fs.files.count_documents({})
+    response = client.post('/upload_project',
+                           data={'btp_name': 'Second Project',
+                                 'project_file': (io.BytesIO(b'project brief'), 'brief.pdf', 'application/pdf')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    second = db.btp_list.find_one({'prof_id': 'uploadfac', 'btp_name': 'Second Project'})
+    assert second['project_file_id'] == project['project_file_id']
+    assert db.fs.files.count_documents({}) == files_before
+
+from app import render_department_letters, send_due_digests, settle_hod_letters, hod_letters_job
+from datetime import datetime, timedelta, timezone
+
+def test_send_email_attaches_pdf_from_memory(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'letterstu'
+        sess['role'] = 'student'
+
+    db.users.delete_many({'id': {'$in': ['letterstu', 'letterfac']}})
+    db.users.insert_many([
+        {'id': 'letterstu', 'full_name': 'Letter Student', 'department': 'LETTERS', 'role': 'student'},
+        {'id': 'letterfac', 'full_name': 'Letter Faculty', 'department': 'LETTERS', 'role': 'faculty'}
+    ])
+    db.btp_list.delete_many({'btp_id': '74001'})
+    db.btp_list.insert_one({'btp_id': '74001', 'btp_name': 'Letter Project', 'prof_id': 'letterfac'})
+    db.application.delete_many({'roll_no': 'letterstu'})
+    db.application.insert_one({'btp_id': '74001', 'roll_no': 'letterstu', 'status': 'Temporarily Confirmed'})
+
+    before = db.outbox.count_documents({})
+    response = client.get('/send_email')
+    assert response.status_code == 302
+    assert db.outbox.count_documents({}) == before + 1
+    queued = db.outbox.find_one(sort=[('created_at', -1)])
+    assert 'filename="74001.pdf"' in queued['message']
+    # Queued is not delivered: the application is confirmed once the outbox has sent the letter
+    application = db.application.find_one({'roll_no': 'letterstu'})
+    assert application['status'] == 'Temporarily Confirmed'
+    assert application['hod_letter']['outbox_id'] == queued['_id']
+    assert client.get('/send_email').status_code == 302
+    assert db.outbox.count_documents({}) == before + 1  # already in flight
+
+    db.outbox.update_one({'_id': queued['_id']}, {'$set': {'status': 'sent'}})
+    settle_hod_letters()
+    assert db.application.find_one({'roll_no': 'letterstu'})['status'] == 'Confirmed'
+    assert db.application.find_one({'roll_no': 'letterstu'})['hod_letter']['status'] == 'sent'
+    assert 'letterstu' in db.btp_list.find_one({'btp_id': '74001'})['students']
+
+
+def test_undelivered_hod_letter_can_be_sent_again(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'letterstu'
+        sess['role'] = 'student'
+    db.users.delete_many({'id': {'$in': ['letterstu', 'letterfac']}})
+    db.users.insert_many([
+        {'id': 'letterstu', 'full_name': 'Letter Student', 'department': 'LETTERS', 'role': 'student'},
+        {'id': 'letterfac', 'full_name': 'Letter Faculty', 'department': 'LETTERS', 'role': 'faculty'}
+    ])
+    db.btp_list.delete_many({'btp_id': '74001'})
+    db.btp_list.insert_one({'btp_id': '74001', 'btp_name': 'Letter Project', 'prof_id': 'letterfac'})
+    db.application.delete_many({'roll_no': 'letterstu'})
+    db.application.insert_one({'btp_id': '74001', 'roll_no': 'letterstu', 'status': 'Temporarily Confirmed'})
+
+    assert client.get('/send_email').status_code == 302
+    outbox_id = db.application.find_one({'roll_no': 'letterstu'})['hod_letter']['outbox_id']
+    db.outbox.update_one({'_id': outbox_id}, {'$set': {'status': 'failed'}})
+    assert settle_hod_letters() == (0, 1)
+    application = db.application.find_one({'roll_no': 'letterstu'})
+    assert application['status'] == 'Temporarily Confirmed' and 'hod_letter' not in application
+
+    # A letter claimed by a sender that died before queueing is put back once its lease runs out
+    db.application.update_one({'roll_no': 'letterstu'}, {'$set': {'hod_letter': {
+        'status': 'sending', 'outbox_id': ObjectId(), 'claimed_at': datetime.now(timezone.utc)}}})
+    assert settle_hod_letters() == (0, 0)
+    assert settle_hod_letters(lease=0) == (0, 1)
+    assert 'hod_letter' not in db.application.find_one({'roll_no': 'letterstu'})
+
+    # An undelivered digest letter waits for the next digest instead
+    batch = ObjectId()
+    db.outbox.insert_one({'_id': batch, 'status': 'failed'})
+    db.application.update_one({'roll_no': 'letterstu'}, {'$set': {'hod_letter': {
+        'status': 'sending', 'department': 'LETTERS', 'queued_at': datetime.now(timezone.utc), 'batch': batch,
+        'outbox_id': batch, 'claimed_at': datetime.now(timezone.utc)}}})
+    assert settle_hod_letters() == (0, 1)
+    letter = db.application.find_one({'roll_no': 'letterstu'})['hod_letter']
+    assert sorted(letter) == ['department', 'queued_at', 'status'] and letter['status'] == 'pending'
+    db.outbox.delete_one({'_id': batch})
+    db.application.delete_many({'roll_no': 'letterstu'})
+
+def test_render_department_letters(client):
+    db.users.delete_many({'id': {'$in': ['batchstu1', 'batchstu2', 'batchstu3', 'batchfac', 'batchcog']}})
+    db.users.insert_many([
+        {'id': 'batchstu1', 'full_name': 'Batch One', 'department': 'BATCH'},
+        {'id': 'batchstu2', 'full_name': 'Batch Two', 'department': 'BATCH'},
+        {'id': 'batchstu3', 'full_name': 'Batch Three', 'department': 'ELSEWHERE'},
+        {'id': 'batchfac', 'full_name': 'Batch Faculty', 'department': 'BATCH'}
+    ])
+    co_guide_id = db.users.insert_one({'id': 'batchcog', 'full_name': 'Batch Co-Guide', 'department': 'BATCH'}).inserted_id
+    db.btp_list.delete_many({'btp_id': '74002'})
+    db.btp_list.insert_one({'btp_id': '74002', 'btp_name': 'Batch Project', 'prof_id': 'batchfac'})
+    db.application.delete_many({'btp_id': '74002'})
+    first = db.application.insert_one({'btp_id': '74002', 'roll_no': 'batchstu1', 'status': 'Temporarily Confirmed'}).inserted_id
+    db.application.insert_many([
+        {'btp_id': '74002', 'roll_no': 'batchstu2', 'status': 'Approved'},
+        {'btp_id': '74002', 'roll_no': 'batchstu3', 'status': 'Temporarily Confirmed'}
+    ])
+    db.co_guides_selected.insert_one({'application_id': first, 'co_guide_id': str(co_guide_id), 'status': 'Approved'})
+
+    with app.test_request_context():
+        letters = render_department_letters('BATCH', processes=0)
+    assert [application['roll_no'] for application, _, _ in letters] == ['batchstu1']
+    application, data, pdf = letters[0]
+    assert data['coguide_name'] == 'Batch Co-Guide'
+    assert data['faculty_name'] == 'Batch Faculty'
+    assert pdf.startswith(b'%PDF')
+
+
+def test_hod_digest_batches_department(client):
+    app.config['HOD_DIGEST_WINDOW'] = 3600
+    try:
+        db.users.delete_many({'id': {'$in': ['digeststu1', 'digeststu2', 'digestfac']}})
+        db.users.insert_many([
+            {'id': 'digeststu1', 'full_name': 'Digest One', 'department': 'DIGEST', 'role': 'student'},
+            {'id': 'digeststu2', 'full_name': 'Digest Two', 'department': 'DIGEST', 'role': 'student'},
+            {'id': 'digestfac', 'full_name': 'Digest Faculty', 'department': 'DIGEST', 'role': 'faculty'}
+        ])
+        db.btp_list.delete_many({'btp_id': {'$in': ['75001', '75002']}})
+        db.btp_list.insert_many([
+            {'btp_id': '75001', 'btp_name': 'Digest Project A', 'prof_id': 'digestfac'},
+            {'btp_id': '75002', 'btp_name': 'Digest Project B', 'prof_id': 'digestfac'}
+        ])
+        db.application.delete_many({'roll_no': {'$in': ['digeststu1', 'digeststu2']}})
+        db.application.insert_many([
+            {'btp_id': '75001', 'roll_no': 'digeststu1', 'status': 'Temporarily Confirmed'},
+            {'btp_id': '75002', 'roll_no': 'digeststu2', 'status': 'Temporarily Confirmed'}
+        ])
+
+        before = db.outbox.count_documents({})
+        for roll_no in ('digeststu1', 'digeststu2'):
+            with client.session_transaction() as sess:
+                sess['id'] = roll_no
+                sess['role'] = 'student'
+            assert client.get('/send_email').status_code == 302
+
+        # Nothing goes out until the window has passed
+        assert db.outbox.count_documents({}) == before
+        pending = list(db.application.find({'roll_no': {'$in': ['digeststu1', 'digeststu2']}}))
+        assert {a['status'] for a in pending} == {'Temporarily Confirmed'}
+        assert {a['hod_letter']['status'] for a in pending} == {'pending'}
+
+        with app.test_request_context():
+            assert send_due_digests() == 0
+
+        # Once the window has passed a request still only queues; the outbox workers' job sends the digest
+        db.application.update_many({'roll_no': {'$in': ['digeststu1', 'digeststu2']}},
+                                   {'$set': {'hod_letter.queued_at': datetime.now(timezone.utc) - timedelta(hours=2)}})
+        assert client.get('/send_email').status_code == 302
+        assert db.outbox.count_documents({}) == before
+        hod_letters_job()
+        with app.test_request_context():
+            assert send_due_digests(window=0) == 0  # already claimed
+
+        assert db.outbox.count_documents({}) == before + 1
+        queued = db.outbox.find_one(sort=[('created_at', -1)])
+        assert 'BTP_applications_DIGEST.pdf' in queued['message']
+        claimed = list(db.application.find({'roll_no': {'$in': ['digeststu1', 'digeststu2']}}))
+        assert {a['status'] for a in claimed} == {'Temporarily Confirmed'}
+        assert {a['hod_letter']['outbox_id'] for a in claimed} == {queued['_id']}
+
+        # Confirmed only once the outbox has delivered the digest
+        db.outbox.update_one({'_id': queued['_id']}, {'$set': {'status': 'sent'}})
+        hod_letters_job()
+        hod_letters_job()  # settling twice changes nothing
+        sent = list(db.application.find({'roll_no': {'$in': ['digeststu1', 'digeststu2']}}))
+        assert {a['status'] for a in sent} == {'Confirmed'}
+        assert {a['hod_letter']['status'] for a in sent} == {'sent'}
+        assert db.btp_list.find_one({'btp_id': '75001'})['students'] == ['digeststu1']
+        assert db.btp_list.find_one({'btp_id': '75002'})['students'] == ['digeststu2']
+    finally:
+        app.config['HOD_DIGEST_WINDOW'] = 0
+
+
+def test_login_rehashes_legacy_plaintext(client):
+    db.users.delete_many({'id': 'plainuser'})
+    db.users.insert_one({'id': 'plainuser', 'password': 'hunter2', 'role': 'student'})
+
+    response = client.post('/login', data={'id': 'plainuser', 'password': 'hunter2'})
+    assert response.headers['Location'] == '/student_home'
+    stored = db.users.find_one({'id': 'plainuser'})['password']
+    assert stored.startswith('scrypt$')
+    assert password_hasher.verify(stored, 'hunter2') == (True, False)
+
+    # the upgraded record keeps working, and the wrong password still fails
+    client.get('/logout')
+    assert client.post('/login', data={'id': 'plainuser', 'password': 'hunter2'}).headers['Location'] == '/student_home'
+    client.get('/logout')
+    assert client.post('/login', data={'id': 'plainuser', 'password': 'wrong'}).headers['Location'] == '/login'
+
+
+def test_co_guide_applications_joined_in_one_aggregation(client):
+    db.users.delete_many({'id': {'$in': ['cogd1', 'guide1']}})
+    co_guide_oid = db.users.insert_one({'id': 'cogd1', 'full_name': 'Co Guide', 'role': 'faculty'}).inserted_id
+    db.users.insert_one({'id': 'guide1', 'full_name': 'Main Guide', 'email': 'guide1@example.com',
+                         'password': 'secret', 'role': 'faculty'})
+    db.btp_list.delete_many({'btp_id': '76001'})
+    db.btp_list.insert_one({'btp_id': '76001', 'btp_name': 'Joined Project', 'prof_id': 'guide1'})
+    application_id = db.application.insert_one({'btp_id': '76001', 'roll_no': 'cogstu1', 'status': 'Pending',
+                                                'notes': 'internal'}).inserted_id
+    db.co_guides_selected.insert_many([
+        {'application_id': application_id, 'co_guide_id': str(co_guide_oid), 'status': 'Pending'},
+        {'application_id': ObjectId(), 'co_guide_id': str(co_guide_oid), 'status': 'Pending'}  # dangling
+    ])
+
+    with client.session_transaction() as sess:
+        sess['id'] = 'cogd1'
+        sess['role'] = 'faculty'
+
+    captured = []
+    from flask import template_rendered
+    def record(sender, template, context, **extra):
+        captured.append(context)
+    template_rendered.connect(record, app)
+    try:
+        response = client.get('/co_guide_applications')
+    finally:
+        template_rendered.disconnect(record, app)
+
+    assert response.status_code == 200
+    assert captured[0]['applications'] == [{
+        '_id': application_id,
+        'btp_id': '76001',
+        'roll_no': 'cogstu1',
+        'status': 'Pending',
+        'btp_name': 'Joined Project',
+        'faculty_name': 'Main Guide',
+        'faculty_email': 'guide1@example.com'
+    }]
+    assert b'guide1@example.com' in response.data
+
+
+def test_view_selected_co_guides_resolves_projected(client):
+    db.users.delete_many({'id': {'$in': ['selstu1', 'selfac1', 'selfac2', 'selfac3']}})
+    db.users.insert_one({'id': 'selstu1', 'full_name': 'Sel Student', 'department': 'SEL', 'role': 'student'})
+    fac_ids = db.users.insert_many([
+        {'id': 'selfac1', 'full_name': 'Sel One', 'department': 'SEL', 'role': 'faculty', 'password': 'p1'},
+        {'id': 'selfac2', 'full_name': 'Sel Two', 'department': 'SEL', 'role': 'faculty', 'password': 'p2'},
+        {'id': 'selfac3', 'full_name': 'Sel Three', 'department': 'OTHER', 'role': 'faculty', 'password': 'p3'}
+    ]).inserted_ids
+    application_id = db.application.insert_one({'btp_id': '77001', 'roll_no': 'selstu1', 'status': 'Approved'}).inserted_id
+
+    with client.session_transaction() as sess:
+        sess['id'] = 'selstu1'
+        sess['role'] = 'student'
+
+    captured = []
+    from flask import template_rendered
+    def record(sender, template, context, **extra):
+        captured.append(context)
+    template_rendered.connect(record, app)
+    try:
+        db.co_guides_selected.insert_one({'application_id': application_id,
+                                          'co_guides_selected': [str(fac_ids[1]), 'not-an-id', str(fac_ids[0])]})
+        assert client.get(f'/view_selected_co_guides/{application_id}').status_code == 200
+        assert captured[-1]['co_guides'] == [{'_id': str(fac_ids[1]), 'full_name': 'Sel Two'},
+                                             {'_id': str(fac_ids[0]), 'full_name': 'Sel One'}]
+
+        db.co_guides_selected.update_one({'application_id': application_id}, {'$set': {'co_guides_selected': ['any']}})
+        assert client.get(f'/view_selected_co_guides/{application_id}').status_code == 200
+        roster = captured[-1]['co_guides']
+        assert sorted(c['full_name'] for c in roster) == ['Sel One', 'Sel Two']
+        assert all(set(c) <= {'_id', 'full_name', 'email'} for c in roster)  # no passwords or other fields
+    finally:
+        template_rendered.disconnect(record, app)
+
+
+def test_faculty_roster_cached_and_invalidated(client):
+    from app import faculty_roster
+    db.users.delete_many({'department': 'ROSTER'})
+    db.users.insert_many([
+        {'id': 'rosstu1', 'full_name': 'Roster Student', 'department': 'ROSTER', 'role': 'student'},
+        {'id': 'rosfa1', 'full_name': 'Roster One', 'email': 'r1@example.com', 'department': 'ROSTER',
+         'role': 'faculty', 'password': 'x'}
+    ])
+    application_id = db.application.insert_one({'btp_id': '78001', 'roll_no': 'rosstu1', 'status': 'Pending'}).inserted_id
+    faculty_roster.invalidate()
+
+    with client.session_transaction() as sess:
+        sess['id'] = 'rosfa1'
+        sess['role'] = 'faculty'
+    assert b'Roster One' in client.get(f'/select_co_guides/{application_id}').data
+    queries = faculty_roster.queries
+    for _ in range(3):
+        assert b'Roster One' in client.get(f'/select_co_guides/{application_id}').data
+    assert faculty_roster.queries == queries  # warm cache: no roster queries
+
+    # A new faculty member verifying their signup shows up straight away
+    token = verifications.create('signup', '123456', id='rosf2', password='x', full_name='Roster Two',
+                                 email='r2@example.com', department='ROSTER', role='faculty')
+    with client.session_transaction() as sess:
+        sess['signup_token'] = token
+    client.post('/verify_otp_signup', data={'otp': '123456'})
+    with client.session_transaction() as sess:
+        sess['id'] = 'rosfa1'
+        sess['role'] = 'faculty'
+    assert b'Roster Two' in client.get(f'/select_co_guides/{application_id}').data
+
+    # ...and a deleted one disappears
+    removed = db.users.find_one({'id': 'rosf2'})['_id']
+    with client.session_transaction() as sess:
+        sess['id'] = 'admin'
+        sess['role'] = 'admin'
+    client.post(f'/delete_user/{removed}')
+    with client.session_transaction() as sess:
+        sess['id'] = 'rosfa1'
+        sess['role'] = 'faculty'
+    page = client.get(f'/select_co_guides/{application_id}').data
+    assert b'Roster Two' not in page
+    assert b'Roster One' in page
+
+
+def test_send_applications_to_co_guides_replaces_rows(client, monkeypatch):
+    from app import mongo
+    from pymongo.errors import OperationFailure
+    application_id = db.application.insert_one({'btp_id': '79001', 'roll_no': 'fanstu1',
+                                                'status': 'Approved by Guide'}).inserted_id
+    db.co_guides_selected.insert_one({'application_id': application_id, 'co_guide_id': 'old', 'status': 'Applied'})
+
+    with client.session_transaction() as sess:
+        sess['id'] = 'fanstu1'
+        sess['role'] = 'student'
+    selected = [f'co_guide_{i}' for i in range(8)]
+    client.post(f'/send_applications_to_co_guides/{application_id}', data={'co_guides[]': selected})
+
+    rows = list(db.co_guides_selected.find({'application_id': application_id}))
+    assert [row['co_guide_id'] for row in rows] == selected
+    assert {row['status'] for row in rows} == {'Applied'}
+    assert db.application.find_one({'_id': application_id})['status'] == 'Applied for Co-Guide'
+
+    # A standalone server without transactions still gets the same writes
+    def no_transactions(*args, **kwargs):
+        raise OperationFailure('Transaction numbers are only allowed on a replica set member or mongos', code=20)
+    monkeypatch.setattr(type(mongo.cx), 'start_session', no_transactions)
+    client.post(f'/send_applications_to_co_guides/{application_id}', data={'co_guides[]': ['only_one']})
+    assert [row['co_guide_id'] for row in db.co_guides_selected.find({'application_id': application_id})] == ['only_one']
+
+
+def test_confirm_project_respects_capacity(client):
+    db.btp_list.delete_many({'btp_id': {'$in': ['81001', '81002']}})
+    db.btp_list.insert_many([
+        {'btp_id': '81001', 'btp_name': 'Small Project', 'prof_id': 'capguide', 'capacity': 1, 'seats_left': 1},
+        {'btp_id': '81002', 'btp_name': 'Other Project', 'prof_id': 'capguide', 'capacity': 1, 'seats_left': 1}
+    ])
+    db.application.delete_many({'btp_id': {'$in': ['81001', '81002']}})
+    db.application.insert_many([
+        {'btp_id': '81001', 'roll_no': 'capstu1', 'status': 'Approved'},
+        {'btp_id': '81001', 'roll_no': 'capstu2', 'status': 'Approved'},
+        {'btp_id': '81002', 'roll_no': 'capstu1', 'status': 'Approved'}
+    ])
+
+    def confirm(roll_no, btp_id):
+        with client.session_transaction() as sess:
+            sess['id'] = roll_no
+            sess['role'] = 'student'
+        client.post('/confirm_project', data={'project_id': btp_id})
+        return db.application.find_one({'roll_no': roll_no, 'btp_id': btp_id})['status']
+
+    def seats(btp_id):
+        return db.btp_list.find_one({'btp_id': btp_id})['seats_left']
+
+    assert confirm('capstu1', '81001') == 'Temporarily Confirmed'
+    assert seats('81001') == 0
+    # the only seat is taken; the second student stays Approved
+    assert confirm('capstu2', '81001') == 'Approved'
+    assert seats('81001') == 0
+
+    # switching projects hands the seat back
+    assert confirm('capstu1', '81002') == 'Temporarily Confirmed'
+    assert db.application.find_one({'roll_no': 'capstu1', 'btp_id': '81001'})['status'] == 'Approved'
+    assert (seats('81001'), seats('81002')) == (1, 0)
+    assert confirm('capstu2', '81001') == 'Temporarily Confirmed'
+    assert seats('81001') == 0
+
+def test_upload_project_sets_capacity(client):
+    from io import BytesIO
+    with client.session_transaction() as sess:
+        sess['id'] = 'capup'
+        sess['role'] = 'faculty'
+    db.btp_list.delete_many({'prof_id': 'capup'})
+    client.post('/upload_project', data={'btp_name': 'Capacity Project', 'capacity': '3',
+                                         'project_file': (BytesIO(b'spec'), 'spec.txt')},
+                content_type='multipart/form-data')
+    project = db.btp_list.find_one({'prof_id': 'capup'})
+    assert (project['capacity'], project['seats_left']) == (3, 3)
+
+def test_reject_leaves_confirmed_application_alone(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'faculty123'
+        sess['role'] = 'faculty'
+    oid = ObjectId()
+    db.application.insert_one({'_id': oid, 'btp_id': '12345', 'roll_no': 'student123', 'status': 'Temporarily Confirmed'})
+    db.co_guides_selected.insert_one({'application_id': oid, 'co_guide_id': 'cg', 'status': 'Approved'})
+
+    client.post(f'/change_application_status/{oid}', data={'action': 'reject'})  # stale approved list
+    assert db.application.find_one({'_id': oid})['status'] == 'Temporarily Confirmed'
+    assert db.co_guides_selected.count_documents({'application_id': oid}) == 1
+
+    db.application.update_one({'_id': oid}, {'$set': {'status': 'Approved'}})
+    client.post(f'/change_application_status/{oid}', data={'action': 'reject'})
+    assert db.application.find_one({'_id': oid})['status'] == 'Pending'
+    assert db.co_guides_selected.count_documents({'application_id': oid}) == 0
+    db.application.delete_one({'_id': oid})
+
+def test_rank_applications_and_applicants(client):
+    db.btp_list.delete_many({'btp_id': {'$in': ['83001', '83002']}})
+    db.btp_list.insert_many([{'btp_id': '83001', 'btp_name': 'Ranked', 'prof_id': 'rankguide'},
+                             {'btp_id': '83002', 'btp_name': 'Other', 'prof_id': 'otherguide'}])
+    db.users.delete_many({'id': 'rankguide'})
+    db.users.insert_one({'id': 'rankguide', 'role': 'faculty', 'full_name': 'Rank Guide', 'email': 'rg@test.com',
+                         'department': 'CSE'})
+    mine = db.application.insert_one({'btp_id': '83001', 'roll_no': 'rankstu', 'status': 'Approved'}).inserted_id
+    other = db.application.insert_one({'btp_id': '83002', 'roll_no': 'otherstu', 'status': 'Approved'}).inserted_id
+
+    with client.session_transaction() as sess:
+        sess['id'] = 'rankstu'
+        sess['role'] = 'student'
+    client.post('/rank_applications', data={f'preference_{mine}': '2', f'preference_{other}': '1'})
+    assert db.application.find_one({'_id': mine})['preference'] == 2
+    assert 'preference' not in db.application.find_one({'_id': other})  # not the student's application
+    response = client.post('/rank_applications', data={f'preference_{mine}': 'first'}, follow_redirects=True)
+    assert b'whole numbers' in response.data
+    client.post('/rank_applications', data={f'preference_{mine}': ''})
+    assert 'preference' not in db.application.find_one({'_id': mine})
+
+    with client.session_transaction() as sess:
+        sess['id'] = 'rankguide'
+        sess['role'] = 'faculty'
+    client.post('/rank_applicants/83001', data={f'guide_rank_{mine}': '1', f'guide_rank_{other}': '1'})
+    assert db.application.find_one({'_id': mine})['guide_rank'] == 1
+    assert 'guide_rank' not in db.application.find_one({'_id': other})
+    client.post('/rank_applicants/83002', data={f'guide_rank_{other}': '1'})  # someone else's project
+    assert 'guide_rank' not in db.application.find_one({'_id': other})
+
+    db.application.delete_many({'_id': {'$in': [mine, other]}})
+    db.btp_list.delete_many({'btp_id': {'$in': ['83001', '83002']}})
+    db.users.delete_many({'id': 'rankguide'})
+
+def test_identical_reports_are_not_shared_between_students(client):
+    content = b'%PDF-1.4 shared template report'
+    db.btp_submission_collection.delete_many({'roll_no': {'$in': ['sharestu1', 'sharestu2']}})
+    file_ids = []
+    for roll_no in ('sharestu1', 'sharestu2'):
+        with client.session_transaction() as sess:
+            sess['id'] = roll_no
+            sess['role'] = 'student'
+        client.post(f'/submit_report/73003/{roll_no}', data={'report_file': (io.BytesIO(content), 'report.pdf')},
+                    content_type='multipart/form-data')
+        file_ids.append(db.btp_submission_collection.find_one({'btp_id': '73003', 'roll_no': roll_no})['file_id'])
+    assert file_ids[0] != file_ids[1]
+    assert fs.get(file_ids[1]).filename == '73003_sharestu2_report.pdf'
+    db.btp_submission_collection.delete_many({'roll_no': {'$in': ['sharestu1', 'sharestu2']}})
+
+def test_bulk_application_approval_reports_a_lost_race(client, monkeypatch):
+    with client.session_transaction() as sess:
+        sess['id'] = 'bulkfac'
+        sess['role'] = 'faculty'
+
+    db.users.delete_many({'id': {'$in': ['bulkfac', 'bulkstu1']}})
+    db.users.insert_many([
+        {'id': 'bulkfac', 'full_name': 'Bulk Faculty', 'role': 'faculty', 'department': 'CSE'},
+        {'id': 'bulkstu1', 'full_name': 'Bulk One', 'department': 'CSE'}
+    ])
+    db.btp_list.delete_many({'btp_id': '72001'})
+    db.btp_list.insert_one({'btp_id': '72001', 'btp_name': 'Bulk Project', 'prof_id': 'bulkfac'})
+    db.application.delete_many({'btp_id': '72001'})
+    application_id = db.application.insert_one({'btp_id': '72001', 'roll_no': 'bulkstu1', 'status': 'Pending'}).inserted_id
+
+    # The application goes to a co-guide between the read and the conditional write
+    collection = type(db.application)
+    bulk_write = collection.bulk_write
+    def move_first(self, operations, **kwargs):
+        db.application.update_one({'_id': application_id}, {'$set': {'status': 'Applied for Co-Guide'}})
+        return bulk_write(self, operations, **kwargs)
+    monkeypatch.setattr(collection, 'bulk_write', move_first)
+
+    response = client.post('/bulk_application_approval', json={'action': 'approve', 'application_ids': [str(application_id)]})
+    body = response.get_json()
+    assert body['modified_count'] == 0
+    assert body['results'] == [{'application_id': str(application_id), 'outcome': 'not_allowed', 'status': 'Applied for Co-Guide'}]
+    assert db.application.find_one({'_id': application_id})['status'] == 'Applied for Co-Guide'
+    db.application.delete_many({'btp_id': '72001'})
+
+def test_set_submission_details_twice_updates_each_student(client):
+    with client.session_transaction() as sess:
+        sess['id'] = 'subfac'
+        sess['role'] = 'faculty'
+
+    db.btp_submission_collection.delete_many({'btp_id': '75001'})
+    db.btp_submission_collection.insert_one({'btp_id': '75001', 'roll_no': 'substu1', 'submitted': True, 'marks': '40'})
+    for deadline, full_marks in (('2024-07-01 12:00', '100'), ('2024-07-08 12:00', '50')):
+        response = client.post('/set_submission_details/75001',
+                               data={'submission_deadline': deadline, 'full_marks': full_marks,
+                                     'students': ['substu1', 'substu2']})
+        assert response.status_code == 302
+        with client.session_transaction() as sess:
+            assert sess.pop('_flashes') == [('success', 'Submission details set successfully.')]
+
+    rows = {row['roll_no']: row for row in db.btp_submission_collection.find({'btp_id': '75001'})}
+    assert sorted(rows) == ['substu1', 'substu2']
+    assert all(row['submission_deadline'] == datetime(2024, 7, 8, 12, 0) for row in rows.values())
+    assert all(row['full_marks'] == '50' for row in rows.values())
+    # A report already handed in keeps its status and marks
+    assert rows['substu1']['submitted'] is True
+    assert rows['substu1']['marks'] == '40'
+    db.btp_submission_collection.delete_many({'btp_id': '75001'})
 
 if __name__ == '__main__':
     pytest.main()
\ No newline at end of file
@@ -0,0 +1,78 @@
+import pytest
+from app import app, db
+from application_status import (InvalidTransition, sources, transition, APPLIED_FOR_CO_GUIDE,
+                                APPROVED, APPROVED_BY_GUIDE, CONFIRMED, PENDING, TEMPORARILY_CONFIRMED)
+
+
+@pytest.fixture
+def applications():
+    db.application_status_test.drop()
+    yield db.application_status_test
+    db.application_status_test.drop()
+
+
+def test_sources_follow_the_table():
+    assert sources(CONFIRMED) == [TEMPORARILY_CONFIRMED]
+    assert sources(APPROVED, PENDING) == [PENDING]
+    with pytest.raises(InvalidTransition):
+        sources(CONFIRMED, PENDING)
+
+
+def test_transition_returns_updated_document(applications):
+    application_id = applications.insert_one({'roll_no': 's1', 'status': PENDING}).inserted_id
+    updated = transition(applications, {'_id': application_id}, APPROVED, PENDING)
+    assert updated['status'] == APPROVED
+    assert updated['roll_no'] == 's1'
+
+
+def test_transition_loses_race_cleanly(applications):
+    application_id = applications.insert_one({'status': PENDING}).inserted_id
+    assert transition(applications, {'_id': application_id}, APPROVED, PENDING)
+    # a second click based on the same stale page does nothing
+    assert transition(applications, {'_id': application_id}, APPROVED, PENDING) is None
+    assert transition(applications, {'_id': application_id}, APPROVED_BY_GUIDE) is None
+    assert applications.find_one({'_id': application_id})['status'] == APPROVED
+
+
+def test_confirmed_is_final(applications):
+    application_id = applications.insert_one({'status': CONFIRMED}).inserted_id
+    for to in (PENDING, APPROVED, TEMPORARILY_CONFIRMED):
+        assert transition(applications, {'_id': application_id}, to) is None
+    assert applications.find_one({'_id': application_id})['status'] == CONFIRMED
+
+
+def test_transition_sets_and_unsets(applications):
+    applications.insert_many([
+        {'roll_no': 's1', 'status': TEMPORARILY_CONFIRMED, 'hod_letter': {'status': 'pending'}},
+        {'roll_no': 's1', 'status': CONFIRMED}
+    ])
+    moved = transition(applications, {'roll_no': 's1'}, APPROVED, TEMPORARILY_CONFIRMED, unset=['hod_letter'])
+    assert moved['status'] == APPROVED and 'hod_letter' not in moved
+    assert sorted(a['status'] for a in applications.find()) == sorted([APPROVED, CONFIRMED])
+    assert all('hod_letter' not in a for a in applications.find())
+
+
+def test_confirm_project_only_from_approved():
+    app.config['TESTING'] = True
+    client = app.test_client()
+    db.application.delete_many({'roll_no': 'statestu1'})
+    db.btp_list.delete_many({'btp_id': {'$in': ['80001', '80002', '80003']}})
+    db.btp_list.insert_many([{'btp_id': btp_id, 'btp_name': btp_id, 'prof_id': 'stateguide', 'capacity': 2,
+                              'seats_left': 2} for btp_id in ('80001', '80002', '80003')])
+    db.application.insert_many([
+        {'btp_id': '80001', 'roll_no': 'statestu1', 'status': APPROVED},
+        {'btp_id': '80002', 'roll_no': 'statestu1', 'status': TEMPORARILY_CONFIRMED},
+        {'btp_id': '80003', 'roll_no': 'statestu1', 'status': PENDING}
+    ])
+    with client.session_transaction() as sess:
+        sess['id'] = 'statestu1'
+        sess['role'] = 'student'
+
+    # a project the guide has not approved cannot be confirmed, and nothing else moves
+    client.post('/confirm_project', data={'project_id': '80003'})
+    statuses = {a['btp_id']: a['status'] for a in db.application.find({'roll_no': 'statestu1'})}
+    assert statuses == {'80001': APPROVED, '80002': TEMPORARILY_CONFIRMED, '80003': PENDING}
+
+    client.post('/confirm_project', data={'project_id': '80001'})
+    statuses = {a['btp_id']: a['status'] for a in db.application.find({'roll_no': 'statestu1'})}
+    assert statuses == {'80001': TEMPORARILY_CONFIRMED, '80002': APPROVED, '80003': PENDING}
@@ -0,0 +1,51 @@
+import base64
+import re
+import zlib
+
+from letters import render_digest, render_letter, render_letters
+
+LETTER = {
+    "btp_id": "12345",
+    "btp_name": "Test Project",
+    "name": "Test Student",
+    "dep": "CSE",
+    "coguide_name": "No co-guide assigned",
+    "faculty_name": "Dr. Test Faculty"
+}
+
+
+def page_text(pdf):
+    # Decoded content streams (reportlab writes them ASCII85 + Flate encoded)
+    streams = re.findall(rb"/Filter \[ /ASCII85Decode /FlateDecode \].*?stream\r?\n(.*?)endstream", pdf, re.S)
+    return b"".join(zlib.decompress(base64.a85decode(stream.strip(), adobe=True)) for stream in streams)
+
+
+def test_render_letter_in_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pdf = render_letter(LETTER)
+    assert pdf.startswith(b'%PDF')
+    assert list(tmp_path.iterdir()) == []  # nothing written to the working directory
+
+
+def test_render_letters_keeps_order():
+    letters = [{**LETTER, "btp_id": str(i)} for i in range(3)]
+    pdfs = render_letters(letters)
+    assert len(pdfs) == 3
+    assert all(pdf.startswith(b'%PDF') for pdf in pdfs)
+    assert pdfs[0] != pdfs[1]
+
+
+def test_render_letters_process_pool_matches_serial():
+    letters = [{**LETTER, "btp_id": str(i)} for i in range(6)]
+    serial = render_letters(letters)
+    pooled = render_letters(letters, processes=2, pool_threshold=4)
+    # reportlab stamps creation time and a random document id, so compare the page content
+    assert [page_text(pdf) for pdf in pooled] == [page_text(pdf) for pdf in serial]
+    for i, pdf in enumerate(pooled):
+        assert f"BTP Id: {i})".encode() in page_text(pdf)
+
+
+def test_render_digest_one_page_per_letter():
+    pdf = render_digest([{**LETTER, "btp_id": str(i)} for i in range(4)])
+    assert pdf.startswith(b'%PDF')
+    assert b'/Count 4' in pdf
@@ -0,0 +1,205 @@
+import socketserver
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from app import app, db, send_otp_signup
+from outbox import Outbox, SMTPPool
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept (or temporarily refuse) a message."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stand-in ESMTP")
+        envelope = {}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stand-in")
+            elif verb == "MAIL":
+                envelope = {"sender": command[10:].strip("<>"), "recipients": []}
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                envelope["recipients"].append(command[8:].strip("<>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b".\r\n", b""):
+                        break
+                    data.append(chunk)
+                if server.refuse > 0:
+                    server.refuse -= 1
+                    self.reply("451 Try again later")
+                else:
+                    server.messages.append({**envelope, "data": b"".join(data).decode()})
+                    self.reply("250 Queued")
+                    if server.hang_up_after_message:
+                        return
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInSMTPHandler)
+        self.messages = []
+        self.refuse = 0
+        self.connections = 0
+        self.hang_up_after_message = False
+
+
+@pytest.fixture
+def smtp_server():
+    server = StandInSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def test_outbox(smtp_server):
+    db.outbox_test.drop()
+    pool = SMTPPool({"host": "127.0.0.1", "port": smtp_server.server_address[1]}, size=2)
+    box = Outbox(db.outbox_test, pool, workers=2, max_attempts=3, backoff=60, poll_interval=0.05)
+    yield box
+    box.stop()
+    db.outbox_test.drop()
+
+
+def test_outbox_delivers_queued_message(test_outbox, smtp_server):
+    outbox_id = test_outbox.enqueue("from@example.com", ["to@example.com"], "Subject: Hi\r\n\r\nHello")
+    assert db.outbox_test.find_one({"_id": outbox_id})["status"] == "pending"
+
+    assert test_outbox.deliver_due() == 1
+    doc = db.outbox_test.find_one({"_id": outbox_id})
+    assert doc["status"] == "sent"
+    assert doc["attempts"] == 1
+    assert smtp_server.messages[0]["recipients"] == ["to@example.com"]
+    assert "Hello" in smtp_server.messages[0]["data"]
+
+
+def test_outbox_retries_with_backoff_then_gives_up(test_outbox, smtp_server):
+    smtp_server.refuse = 10
+    outbox_id = test_outbox.enqueue("from@example.com", ["to@example.com"], "Subject: Hi\r\n\r\nHello")
+
+    assert test_outbox.deliver_due() == 1
+    doc = db.outbox_test.find_one({"_id": outbox_id})
+    assert doc["status"] == "pending"
+    assert doc["attempts"] == 1
+    assert "451" in doc["last_error"]
+    assert doc["next_attempt_at"].replace(tzinfo=timezone.utc) > datetime.now(timezone.utc) + timedelta(seconds=50)
+    assert test_outbox.deliver_due() == 0  # not due again until the backoff has passed
+
+    for attempts in (2, 3):
+        db.outbox_test.update_one({"_id": outbox_id}, {"$set": {"next_attempt_at": datetime.now(timezone.utc)}})
+        assert test_outbox.deliver_due() == 1
+        assert db.outbox_test.find_one({"_id": outbox_id})["attempts"] == attempts
+    assert db.outbox_test.find_one({"_id": outbox_id})["status"] == "failed"
+    assert smtp_server.messages == []
+
+
+def test_outbox_reclaims_expired_lease(test_outbox, smtp_server):
+    outbox_id = test_outbox.enqueue("from@example.com", ["to@example.com"], "Subject: Hi\r\n\r\nHello")
+    assert test_outbox.claim()["_id"] == outbox_id
+    assert test_outbox.claim() is None  # leased to the first claimer
+
+    db.outbox_test.update_one({"_id": outbox_id}, {"$set": {"lease_expires_at": datetime.now(timezone.utc)}})
+    assert test_outbox.deliver_due() == 1
+    assert db.outbox_test.find_one({"_id": outbox_id})["status"] == "sent"
+
+
+def test_outbox_workers_deliver_in_background(test_outbox, smtp_server):
+    test_outbox.start()
+    for i in range(5):
+        test_outbox.enqueue("from@example.com", [f"to{i}@example.com"], f"Subject: {i}\r\n\r\nHello")
+    for _ in range(100):
+        if len(smtp_server.messages) == 5:
+            break
+        threading.Event().wait(0.05)
+    assert sorted(m["recipients"][0] for m in smtp_server.messages) == [f"to{i}@example.com" for i in range(5)]
+
+
+def test_outbox_workers_run_periodic_jobs(test_outbox):
+    runs = []
+    test_outbox.every(3600, lambda: runs.append(1))
+    test_outbox.every(3600, lambda: 1 / 0)  # a failing job does not stop the workers
+    test_outbox.start()
+    for _ in range(100):
+        if runs:
+            break
+        threading.Event().wait(0.05)
+    test_outbox.run_due_jobs()  # not due again for an hour
+    assert runs == [1]
+    assert test_outbox.running
+
+
+def test_send_otp_signup_only_queues():
+    app.config['TESTING'] = True  # keep the real delivery threads from starting
+    before = db.outbox.count_documents({"recipients": "queued@example.com"})
+    send_otp_signup(123456, "queued@example.com")
+    doc = db.outbox.find_one({"recipients": "queued@example.com"}, sort=[("created_at", -1)])
+    assert db.outbox.count_documents({"recipients": "queued@example.com"}) == before + 1
+    assert doc["status"] == "pending"
+    assert "123456" in doc["message"]
+
+
+def test_smtp_pool_reuses_one_session(test_outbox, smtp_server):
+    for i in range(20):
+        test_outbox.enqueue("from@example.com", [f"to{i}@example.com"], "Subject: Hi\r\n\r\nHello")
+    assert test_outbox.deliver_due() == 20
+    assert len(smtp_server.messages) == 20
+    assert smtp_server.connections == 1
+    assert test_outbox.smtp.connections_opened == 1
+
+
+def test_smtp_pool_keeps_session_after_refusal(test_outbox, smtp_server):
+    smtp_server.refuse = 1
+    test_outbox.enqueue("from@example.com", ["to@example.com"], "Subject: Hi\r\n\r\nHello")
+    test_outbox.enqueue("from@example.com", ["to2@example.com"], "Subject: Hi\r\n\r\nHello")
+    test_outbox.deliver_due()
+    assert [m["recipients"] for m in smtp_server.messages] == [["to2@example.com"]]
+    assert smtp_server.connections == 1
+
+
+def test_smtp_pool_reconnects_dropped_session(smtp_server):
+    smtp_server.hang_up_after_message = True
+    pool = SMTPPool({"host": "127.0.0.1", "port": smtp_server.server_address[1]}, size=1)
+    try:
+        for i in range(3):
+            pool.sendmail("from@example.com", [f"to{i}@example.com"], "Subject: Hi\r\n\r\nHello")
+    finally:
+        pool.close()
+    assert len(smtp_server.messages) == 3
+    assert smtp_server.connections == 3
+
+
+def test_smtp_pool_replaces_idle_sessions(smtp_server):
+    pool = SMTPPool({"host": "127.0.0.1", "port": smtp_server.server_address[1]}, size=1, max_idle=0)
+    try:
+        pool.sendmail("from@example.com", ["a@example.com"], "Subject: Hi\r\n\r\nHello")
+        threading.Event().wait(0.01)
+        pool.sendmail("from@example.com", ["b@example.com"], "Subject: Hi\r\n\r\nHello")
+    finally:
+        pool.close()
+    assert pool.connections_opened == 2
@@ -0,0 +1,40 @@
+from passwords import PasswordHasher, calibrate
+
+
+def test_hash_round_trip():
+    hasher = PasswordHasher(n=2 ** 10)
+    stored = hasher.hash('s3cret')
+    assert stored.startswith('scrypt$1024$8$1$')
+    assert 's3cret' not in stored
+    assert hasher.verify(stored, 's3cret') == (True, False)
+    assert hasher.verify(stored, 'wrong') == (False, False)
+    assert hasher.hash('s3cret') != stored  # salted
+
+
+def test_legacy_plaintext_needs_rehash():
+    hasher = PasswordHasher(n=2 ** 10)
+    assert hasher.verify('s3cret', 's3cret') == (True, True)
+    assert hasher.verify('s3cret', 'wrong') == (False, True)
+
+
+def test_outdated_parameters_need_rehash():
+    old = PasswordHasher(n=2 ** 10).hash('s3cret')
+    assert PasswordHasher(n=2 ** 11).verify(old, 's3cret') == (True, True)
+    assert PasswordHasher(n=2 ** 10, r=4).verify(old, 's3cret') == (True, True)
+
+
+def test_stronger_hash_is_kept():
+    strong = PasswordHasher(n=2 ** 11).hash('s3cret')
+    assert PasswordHasher(n=2 ** 10).verify(strong, 's3cret') == (True, False)
+
+
+def test_unknown_account_and_garbage():
+    hasher = PasswordHasher(n=2 ** 10)
+    assert hasher.verify(None, 's3cret') == (False, False)
+    assert hasher.verify('scrypt$not$a$valid$hash', 's3cret') == (False, False)
+    assert hasher.verify('s3cret', None) == (False, False)
+
+
+def test_calibrate_stays_in_bounds():
+    assert calibrate(target_ms=0, min_n=2 ** 10) == 2 ** 10
+    assert calibrate(target_ms=10 ** 6, min_n=2 ** 10, max_n=2 ** 12) == 2 ** 12
@@ -0,0 +1,71 @@
+import pytest
+from app import app, db, rate_limiter
+from ratelimit import MemoryRateLimiter, MongoRateLimiter
+
+
+@pytest.fixture(params=['memory', 'mongo'])
+def limiter(request):
+    if request.param == 'memory':
+        yield MemoryRateLimiter()
+    else:
+        db.rate_limits_test.drop()
+        yield MongoRateLimiter(db.rate_limits_test)
+        db.rate_limits_test.drop()
+
+
+def test_bucket_allows_burst_then_refuses(limiter):
+    assert [limiter.hit('k', 3, 60)[0] for _ in range(4)] == [True, True, True, False]
+    allowed, retry_after = limiter.hit('k', 3, 60)
+    assert not allowed
+    assert 19 < retry_after <= 20  # one token refills every 20 seconds
+
+
+def test_buckets_are_independent(limiter):
+    for _ in range(2):
+        limiter.hit('a', 2, 60)
+    assert limiter.hit('a', 2, 60)[0] is False
+    assert limiter.hit('b', 2, 60)[0] is True
+
+
+def test_bucket_refills(limiter, monkeypatch):
+    import ratelimit
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+    for _ in range(2):
+        assert limiter.hit('k', 2, 60)[0]
+    assert not limiter.hit('k', 2, 60)[0]
+    now[0] += 30
+    assert limiter.hit('k', 2, 60)[0]
+    assert not limiter.hit('k', 2, 60)[0]
+
+
+def test_forgot_password_throttled_before_any_mail():
+    app.config['TESTING'] = True
+    rate_limiter.reset()
+    client = app.test_client()
+    db.users.delete_many({'email': 'throttled@example.com'})
+    db.users.insert_one({'id': 'throttled', 'email': 'throttled@example.com', 'password': 'x'})
+    before = db.outbox.count_documents({'recipients': 'throttled@example.com'})
+
+    burst = app.config['RATE_LIMITS']['forgot_password']['account'][0]
+    statuses = [client.post('/forgot_password', data={'email': 'Throttled@example.com'}).status_code
+                for _ in range(burst + 2)]
+    assert statuses == [302] * burst + [429, 429]
+    assert db.outbox.count_documents({'recipients': 'throttled@example.com'}) == before + burst
+
+    response = client.post('/forgot_password', data={'email': 'throttled@example.com'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    rate_limiter.reset()
+
+
+def test_login_throttled_per_ip():
+    app.config['TESTING'] = True
+    rate_limiter.reset()
+    client = app.test_client()
+    burst = app.config['RATE_LIMITS']['login']['ip'][0]
+    # different accounts, same address
+    statuses = [client.post('/login', data={'id': f'nobody{i}', 'password': 'x'}).status_code for i in range(burst + 1)]
+    assert statuses[-1] == 429
+    assert 429 not in statuses[:-1]
+    rate_limiter.reset()
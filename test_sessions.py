@@ -0,0 +1,121 @@
+import pytest
+from flask import Flask, session
+from app import app, db
+from sessions import MongoSessionInterface
+
+
+class CountingCollection:
+    """Wraps a collection and counts find_one calls."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.reads = 0
+
+    def find_one(self, *args, **kwargs):
+        self.reads += 1
+        return self.collection.find_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+@pytest.fixture
+def store():
+    db.sessions_test.drop()
+    yield CountingCollection(db.sessions_test)
+    db.sessions_test.drop()
+
+
+@pytest.fixture
+def small_app(store):
+    small = Flask(__name__)
+    small.config['SECRET_KEY'] = 'test'
+    small.session_interface = MongoSessionInterface(store, cache_ttl=60)
+
+    @small.route('/login/<user_id>')
+    def login(user_id):
+        session['id'] = user_id
+        session['role'] = 'student'
+        return 'ok'
+
+    @small.route('/role')
+    def role():
+        return session.get('role') or 'anonymous'
+
+    @small.route('/logout')
+    def logout():
+        session.clear()
+        return 'bye'
+
+    return small
+
+
+def test_cookie_only_carries_session_id(small_app, store):
+    client = small_app.test_client()
+    response = client.get('/login/21CS30035')
+    cookie = response.headers['Set-Cookie']
+    assert '21CS30035' not in cookie and 'student' not in cookie
+    doc = store.collection.find_one()
+    assert doc['data'] == {'id': '21CS30035', 'role': 'student'}
+    assert doc['user_id'] == '21CS30035'
+
+
+def test_reads_served_from_cache_without_resending_cookie(small_app, store):
+    client = small_app.test_client()
+    client.get('/login/21CS30035')
+    reads = store.reads
+    for _ in range(5):
+        response = client.get('/role')
+        assert response.data == b'student'
+        assert 'Set-Cookie' not in response.headers
+    assert store.reads == reads
+
+
+def test_login_rotates_session_id(small_app, store):
+    client = small_app.test_client()
+    client.get('/login/first')
+    first = client.get_cookie('session').value
+    client.get('/login/second')
+    assert client.get_cookie('session').value != first
+    assert store.collection.count_documents({}) == 1
+
+
+def test_logout_deletes_session(small_app, store):
+    client = small_app.test_client()
+    client.get('/login/21CS30035')
+    client.get('/logout')
+    assert store.collection.count_documents({}) == 0
+    assert client.get('/role').data == b'anonymous'
+
+
+def test_revoke_user_ends_all_sessions(small_app, store):
+    laptop, phone, other = (small_app.test_client() for _ in range(3))
+    laptop.get('/login/21CS30035')
+    phone.get('/login/21CS30035')
+    other.get('/login/21CS30036')
+    small_app.session_interface.revoke_user('21CS30035')
+    assert laptop.get('/role').data == b'anonymous'
+    assert phone.get('/role').data == b'anonymous'
+    assert other.get('/role').data == b'student'
+
+
+def test_delete_user_revokes_sessions():
+    app.config['TESTING'] = True
+    db.users.delete_many({'id': 'revokeme'})
+    user_oid = db.users.insert_one({'id': 'revokeme', 'role': 'student', 'password': 'x'}).inserted_id
+
+    victim = app.test_client()
+    with victim.session_transaction() as sess:
+        sess['id'] = 'revokeme'
+        sess['role'] = 'student'
+    assert db.sessions.count_documents({'user_id': 'revokeme'}) == 1
+
+    admin = app.test_client()
+    with admin.session_transaction() as sess:
+        sess['id'] = 'admin'
+        sess['role'] = 'admin'
+    admin.post(f'/delete_user/{user_oid}')
+
+    assert db.sessions.count_documents({'user_id': 'revokeme'}) == 0
+    with victim.session_transaction() as sess:
+        assert 'id' not in sess
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from app import app, db
+from verifications import PendingVerifications
+
+
+@pytest.fixture
+def pending():
+    db.pending_verifications_test.drop()
+    yield PendingVerifications(db.pending_verifications_test, ttl=600, max_attempts=3)
+    db.pending_verifications_test.drop()
+
+
+def test_correct_otp_returns_data_once(pending):
+    token = pending.create('signup', 123456, id='123456789', email='a@example.com')
+    assert pending.verify(token, 'signup', '123456') == ('ok', {'id': '123456789', 'email': 'a@example.com'})
+    # consumed: replaying the same cookie gets nowhere
+    assert pending.verify(token, 'signup', '123456') == ('expired', None)
+
+
+def test_nothing_stored_in_the_clear(pending):
+    token = pending.create('signup', 123456, email='a@example.com')
+    doc = db.pending_verifications_test.find_one()
+    assert token not in str(doc)
+    assert '123456' not in doc['otp']
+
+
+def test_attempts_are_limited(pending):
+    token = pending.create('signup', 123456)
+    assert pending.verify(token, 'signup', '000000')[0] == 'incorrect'
+    assert pending.verify(token, 'signup', '111111')[0] == 'incorrect'
+    assert pending.verify(token, 'signup', '222222')[0] == 'incorrect'
+    # out of attempts; even the right OTP no longer works
+    assert pending.verify(token, 'signup', '123456')[0] == 'expired'
+
+
+def test_expired_otp_is_rejected(pending):
+    token = pending.create('signup', 123456)
+    db.pending_verifications_test.update_one({}, {'$set': {'expires_at': datetime.now(timezone.utc) - timedelta(seconds=1)}})
+    assert pending.verify(token, 'signup', '123456') == ('expired', None)
+
+
+def test_purpose_must_match(pending):
+    token = pending.create('reset_password', 123456, email='a@example.com')
+    assert pending.verify(token, 'signup', '123456')[0] == 'expired'
+
+
+def test_verified_entry_consumed_once(pending):
+    token = pending.create('reset_password', 123456, email='a@example.com')
+    assert pending.consume(token, 'reset_password') is None  # OTP not entered yet
+    assert pending.verify(token, 'reset_password', '123456', consume=False) == ('ok', {'email': 'a@example.com'})
+    assert pending.consume(token, 'reset_password') == {'email': 'a@example.com'}
+    assert pending.consume(token, 'reset_password') is None
+
+
+def test_reset_password_needs_verified_otp():
+    app.config['TESTING'] = True
+    client = app.test_client()
+    db.users.delete_many({'email': 'resetme@example.com'})
+    db.users.insert_one({'id': 'resetme', 'email': 'resetme@example.com', 'password': 'old'})
+
+    client.post('/forgot_password', data={'email': 'resetme@example.com'})
+    with client.session_transaction() as sess:
+        assert set(sess.keys()) - {'_flashes'} == {'reset_token'}
+
+    # skipping the OTP step does not unlock the reset
+    client.post('/reset_password', data={'password': 'new', 'confirm_password': 'new'})
+    assert db.users.find_one({'id': 'resetme'})['password'] == 'old'
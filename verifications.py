@@ -0,0 +1,85 @@
+"""Server-side store for OTP verifications that are still in progress.
+
+The cookie session only carries an opaque token. The OTP, the signup form and the
+attempt counter live in a Mongo collection with a TTL index on expires_at, so
+abandoned verifications disappear on their own and a replayed cookie is worthless
+once its verification has been used, expired or run out of attempts.
+
+Neither the token nor the OTP is stored as is: documents are keyed by a hash of the
+token and the OTP is kept as an HMAC keyed by the token, so a copy of the
+collection cannot be used to finish someone else's verification.
+"""
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+
+def _token_key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _otp_digest(token, otp):
+    return hmac.new(token.encode(), str(otp).encode(), hashlib.sha256).hexdigest()
+
+
+class PendingVerifications:
+    def __init__(self, collection, ttl=600, max_attempts=5):
+        # ttl: seconds an OTP (and, once verified, the follow-up step) stays usable
+        self.collection = collection
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+
+    def create(self, purpose, otp, **data):
+        # Returns the token to put in the session
+        token = secrets.token_urlsafe(32)
+        now = datetime.now(timezone.utc)
+        self.collection.insert_one({
+            "_id": _token_key(token),
+            "purpose": purpose,
+            "otp": _otp_digest(token, otp),
+            "attempts": 0,
+            "verified": False,
+            "data": data,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl)
+        })
+        return token
+
+    def verify(self, token, purpose, otp, consume=True):
+        # Returns (outcome, data) with outcome one of "ok", "incorrect" or "expired".
+        # A correct OTP is matched, and the entry consumed (or marked verified), in a single round trip.
+        if not token:
+            return "expired", None
+        now = datetime.now(timezone.utc)
+        live = {"_id": _token_key(token), "purpose": purpose, "verified": False,
+                "expires_at": {"$gt": now}, "attempts": {"$lt": self.max_attempts}}
+        match = {**live, "otp": _otp_digest(token, otp)}
+        if consume:
+            doc = self.collection.find_one_and_delete(match)
+        else:
+            doc = self.collection.find_one_and_update(
+                match,
+                {"$set": {"verified": True, "expires_at": now + timedelta(seconds=self.ttl)}},
+                return_document=ReturnDocument.AFTER
+            )
+        if doc:
+            return "ok", doc["data"]
+
+        doc = self.collection.find_one_and_update(live, {"$inc": {"attempts": 1}},
+                                                  return_document=ReturnDocument.AFTER)
+        if doc is None:
+            return "expired", None
+        if doc["attempts"] >= self.max_attempts:
+            self.collection.delete_one({"_id": doc["_id"]})
+        return "incorrect", None
+
+    def consume(self, token, purpose):
+        # Take a verified entry (e.g. the password reset that follows a correct OTP); returns its data or None
+        if not token:
+            return None
+        doc = self.collection.find_one_and_delete({"_id": _token_key(token), "purpose": purpose, "verified": True,
+                                                   "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return doc["data"] if doc else None